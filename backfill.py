@@ -0,0 +1,174 @@
+from multiprocessing import Pool
+import logging
+import os
+import time
+
+import pandas as pd
+
+from dimension.cancel_dimension import CancelDimension
+from dimension.carrier_dimension import CarrierDimension
+from dimension.date_dimension import DateDimension
+from dimension.flight_dimension import FlightDimension
+from dimension.travel_dimension import TravelDimension
+from fact.flight_arrival_fact import FlightArrivalFact
+from raw.raw_data import get_flight_arrival_files, cache_flight_arrival_data
+from raw.raw_scanner import RawDataScanner
+from util.utils import reset_db_client, get_metrics
+
+# Years to load: a range (1987-2008) or a list (2007,2008)
+YEARS = os.getenv("FL_ARR_YEARS", "1987-2008")
+# Years processed at the same time
+PROCESSES = int(os.getenv("FL_ARR_BACKFILL_PROCESSES", "4"))
+# Files downloaded at the same time
+DOWNLOAD_THREADS = int(os.getenv("FL_ARR_DOWNLOAD_THREADS", "4"))
+FACT_WORKERS = int(os.getenv("FL_ARR_WORKERS", "0"))
+FACT_WRITERS = int(os.getenv("FL_ARR_WRITERS", "0"))
+FACT_RELOAD = os.getenv("FL_ARR_RELOAD", "0") == "1"
+FACT_SWAP = os.getenv("FL_ARR_SWAP", "0") == "1"
+FACT_BULK = os.getenv("FL_ARR_BULK", "0") == "1"
+
+
+def parse_years(years):
+	"""
+		Years of a range (1987-2008) or a list (2007,2008)
+	:return: list of int
+	"""
+	if "-" in years:
+		first, last = years.split("-")
+		return list(range(int(first), int(last) + 1))
+
+	return [int(year) for year in years.split(",")]
+
+
+def init_process():
+	"""
+		Pool initializer: the connections of the parent process are not used by the children.
+	"""
+	logging.getLogger().setLevel(logging.INFO)
+	reset_db_client()
+
+
+def prepare_year(year):
+	"""
+		Converts the year file (already downloaded) to the parquet cache
+	"""
+	start_time = time.time()
+	cache_flight_arrival_data(year)
+	logging.info("Backfill - {} - cached - {:.2f} s".format(year, time.time() - start_time))
+
+
+def discover_year(year):
+	"""
+		Finds the flight and travel members of a year that are not on the dimensions yet, without saving them
+		(they are merged with the other years by the parent process, see BaseDimension.save_members).
+	:return: dict - table name -> (dataframe, natural key columns)
+	"""
+	start_time = time.time()
+	get_metrics().reset()
+	dimensions = [FlightDimension(year), TravelDimension(year)]
+	for dimension in dimensions:
+		dimension.collect = True
+	try:
+		RawDataScanner(year=year, consumers=dimensions).run()
+	finally:
+		get_metrics().log_summary("Metrics - {} - discover".format(year))
+
+	members = {}
+	for dimension in dimensions:
+		members.update(dimension.get_collected())
+	logging.info("Backfill - {} - {} - {:.2f} s".format(
+		year, ", ".join("{} {} members".format(len(df), table) for table, (df, _) in members.items()),
+		time.time() - start_time))
+
+	return members
+
+
+def load_fact(year):
+	"""
+		Loads the fact of a year (all the dimensions are already loaded)
+	:return: (year, records loaded, seconds)
+	"""
+	start_time = time.time()
+	get_metrics().reset()
+	fact = FlightArrivalFact(year)
+	if FACT_RELOAD:
+		fact.delete()
+	try:
+		rows = fact.run(workers=FACT_WORKERS, writers=FACT_WRITERS, swap=FACT_SWAP, bulk=FACT_BULK)
+	finally:
+		get_metrics().log_summary("Metrics - {} - fact".format(year))
+
+	return year, rows, time.time() - start_time
+
+
+def save_members(members_by_year):
+	"""
+		Merges the members discovered in each year (the first year of each key wins) and saves each dimension
+		once, so the fact loads do not contend on new members.
+	:param members_by_year: list of discover_year results, in year order
+	"""
+	dimensions = {"flight_dimension": FlightDimension(None), "travel_dimension": TravelDimension(None)}
+	for table_name, dimension in dimensions.items():
+		found = [members[table_name] for members in members_by_year if table_name in members]
+		if not found:
+			continue
+
+		rows = dimension.save_members(
+			pd.concat([df for df, _ in found], ignore_index=True), table_name=table_name, key_columns=found[0][1])
+		logging.info("Backfill - {} - {} new members".format(table_name, rows))
+
+
+def log_phase(phase, start_time):
+	end_time = time.time()
+	logging.info("Backfill - {} - {:.2f} s".format(phase, end_time - start_time))
+
+	return end_time
+
+
+def main():
+	"""
+		Loads several years: the files are downloaded at the same time (threads), then they are converted to the
+		cache and the dimension members discovered in a process pool (one year per task), the members of all the
+		years are saved by this process and then the facts are loaded, again one year per task. The rows/s of each
+		year and of the whole backfill are logged.
+	"""
+	logging.getLogger().setLevel(logging.INFO)
+	years = parse_years(YEARS)
+	logging.info("**** Backfill of {} years: {}".format(len(years), ", ".join(str(year) for year in years)))
+
+	start_time = time.time()
+	phase_time = start_time
+	# the pool processes are forked without the connections of this process
+	reset_db_client()
+	get_flight_arrival_files(years, threads=DOWNLOAD_THREADS)
+	phase_time = log_phase("download", phase_time)
+
+	with Pool(processes=min(PROCESSES, len(years)), initializer=init_process) as pool:
+		pool.map(prepare_year, years, chunksize=1)
+		phase_time = log_phase("cache", phase_time)
+
+		CarrierDimension().run()
+		CancelDimension(years[0], static=True).run()
+		for year in years:
+			DateDimension(year, from_calendar=True).run()
+		phase_time = log_phase("carrier, cancel and date dimensions", phase_time)
+
+		save_members(pool.map(discover_year, years, chunksize=1))
+		phase_time = log_phase("flight and travel dimensions", phase_time)
+
+		total_rows = 0
+		for year, rows, elapsed in pool.imap_unordered(load_fact, years):
+			total_rows += rows
+			logging.info("Backfill - {} - {} records - {:.2f} s - {:.0f} rows/s".format(
+				year, rows, elapsed, rows / elapsed if elapsed > 0 else 0))
+		log_phase("fact", phase_time)
+
+	elapsed = time.time() - start_time
+	logging.info("Backfill - {} years - {} records - {:.2f} s - {:.0f} rows/s".format(
+		len(years), total_rows, elapsed, total_rows / elapsed if elapsed > 0 else 0))
+	# the dimensions loaded by this process (the years are logged by the pool processes)
+	get_metrics().log_summary("Metrics - backfill")
+
+
+if __name__ == "__main__":
+	main()
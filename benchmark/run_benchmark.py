@@ -0,0 +1,206 @@
+"""
+	Loader benchmark with a synthetic year file (see benchmark/synthetic_data.py). The file is written to the
+	raw directory (FL_ARR_RAW_DIR) with a year that is not in the Data Expo set and loaded to a scratch schema of
+	the configured database (PGHOST), created from db/sql/FlightArrival_create.sql and dropped at the end (unless
+	--keep-data), so the synthetic members never reach the dimensions of the reports. The time of each step is
+	written as json:
+
+	PYTHONPATH=. python benchmark/run_benchmark.py --rows 500000 --output bench.json
+"""
+from collections import OrderedDict
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmark.synthetic_data import generate_flights, write_year_file
+from definitions import ROOT_DIR
+from dimension.cancel_dimension import CancelDimension
+from dimension.carrier_dimension import CarrierDimension
+from dimension.date_dimension import DateDimension
+from dimension.flight_dimension import FlightDimension
+from dimension.travel_dimension import TravelDimension
+from fact.flight_arrival_fact import FlightArrivalFact
+from raw.raw_data import CHUNK_SIZE, CACHE_DIR, get_file_path, cache_flight_arrival_data
+from util.pg_schema import SCHEMA_FILE
+from util.utils import get_db_client
+
+
+class StepTimer:
+	"""
+		Wall and CPU time of the benchmark steps. A step measured several times (e.g. once per chunk) is summed.
+	"""
+
+	def __init__(self):
+		self.steps = OrderedDict()
+
+	def measure(self, name, function, rows=None):
+		"""
+			Runs a function and adds its time to the step
+		:param rows: Records processed (None uses len() of the result, if it has one)
+		:return: Result of the function
+		"""
+		start_time, start_cpu = time.time(), time.process_time()
+		result = function()
+		wall, cpu = time.time() - start_time, time.process_time() - start_cpu
+
+		if rows is None and hasattr(result, "__len__"):
+			rows = len(result)
+		step = self.steps.setdefault(name, {"calls": 0, "rows": 0, "seconds": 0.0, "cpu_seconds": 0.0})
+		step["calls"] += 1
+		step["rows"] += rows or 0
+		step["seconds"] += wall
+		step["cpu_seconds"] += cpu
+
+		return result
+
+	def to_dict(self):
+		return OrderedDict(
+			(name, dict(step, rows_per_second=step["rows"] / step["seconds"] if step["seconds"] > 0 else None))
+			for name, step in self.steps.items())
+
+
+def get_version():
+	"""
+		Commit of the code (None outside a git repository)
+	"""
+	try:
+		return subprocess.check_output(
+			["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def create_schema(schema):
+	"""
+		Creates a scratch schema (dropping an old one) with the tables of db/sql/FlightArrival_create.sql
+	"""
+	with open(SCHEMA_FILE) as f:
+		sql = f.read()
+
+	conn = get_db_client().get_conn_engine().raw_connection()
+	try:
+		cur = conn.cursor()
+		cur.execute("DROP SCHEMA IF EXISTS {0} CASCADE; CREATE SCHEMA {0}; SET LOCAL search_path TO {0}".format(schema))
+		cur.execute(sql)
+		conn.commit()
+	finally:
+		conn.close()
+
+
+def drop_schema(schema):
+	conn = get_db_client().get_conn_engine().raw_connection()
+	try:
+		conn.cursor().execute("DROP SCHEMA IF EXISTS {} CASCADE".format(schema))
+		conn.commit()
+	finally:
+		conn.close()
+
+
+def run_fact(timer, year):
+	"""
+		Loads the year into the fact (from scratch), timing the read, lookups, transform and save of each chunk
+	"""
+	fact = FlightArrivalFact(year)
+	fact.delete()
+	fact.create_partition()
+
+	df_iter = fact.load_state.iter_new_chunks(fact.file_to_df(CHUNK_SIZE))
+	while True:
+		df = timer.measure("fact.read", lambda: next(df_iter, None))
+		if df is None:
+			break
+		rows = len(df)
+
+		df = timer.measure("fact.apply_lookup", lambda: fact.apply_lookup(df))
+		df = timer.measure("fact.transform", lambda: fact.transform(df))
+		timer.measure("fact.save", lambda: fact.save(df, fact.load_state.next_chunk()), rows=rows)
+
+
+def run_benchmark(year, rows, seed=0, cache=False, keep_file=False, keep_data=False, schema="flight_benchmark"):
+	"""
+		Generates the synthetic year and times the cache conversion (optional), the five dimensions and the steps of
+		the fact, in a scratch schema.
+	:param keep_data: Keeps the scratch schema
+	:param schema: Scratch schema
+	:return: dict (json)
+	"""
+	timer = StepTimer()
+	file_path = get_file_path(year)
+	# every connection of the loaders (libpq) uses the scratch schema
+	os.environ["PGOPTIONS"] = "-c search_path={}".format(schema)
+	create_schema(schema)
+
+	df = timer.measure("generate", lambda: generate_flights(year, rows, seed=seed))
+	timer.measure("write_file", lambda: write_year_file(df, file_path), rows=rows)
+	del df
+
+	try:
+		if cache:
+			timer.measure("cache", lambda: cache_flight_arrival_data(year), rows=rows)
+
+		timer.measure("carrier_dimension.run", lambda: CarrierDimension().run())
+		timer.measure("cancel_dimension.run", lambda: CancelDimension(year).run(), rows=rows)
+		timer.measure("date_dimension.run", lambda: DateDimension(year).run(), rows=rows)
+		timer.measure("flight_dimension.run", lambda: FlightDimension(year).run(), rows=rows)
+		timer.measure("travel_dimension.run", lambda: TravelDimension(year).run(), rows=rows)
+		run_fact(timer, year)
+	finally:
+		if not keep_data:
+			drop_schema(schema)
+		if not keep_file:
+			for path in [file_path] + glob.glob(os.path.join(CACHE_DIR, "{}-*.parquet".format(year))):
+				os.remove(path)
+
+	return OrderedDict([
+		("version", get_version()),
+		("timestamp", datetime.datetime.now().isoformat()),
+		("year", year),
+		("rows", rows),
+		("seed", seed),
+		("cache", cache),
+		("schema", schema),
+		("chunk_size", CHUNK_SIZE),
+		("python", platform.python_version()),
+		("pandas", pd.__version__),
+		("numpy", np.__version__),
+		("steps", timer.to_dict())
+	])
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Loader benchmark with a synthetic year file")
+	parser.add_argument("--rows", type=int, default=200000, help="Flights of the synthetic year")
+	parser.add_argument("--year", type=int, default=2099, help="Year of the synthetic file")
+	parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic file")
+	parser.add_argument("--cache", action="store_true", help="Converts the file to the parquet cache first")
+	parser.add_argument("--keep-file", action="store_true", help="Keeps the synthetic file")
+	parser.add_argument("--keep-data", action="store_true", help="Keeps the scratch schema with the synthetic year")
+	parser.add_argument("--schema", default="flight_benchmark", help="Scratch schema (dropped at the end)")
+	parser.add_argument("--output", help="Json file (default: stdout)")
+	args = parser.parse_args()
+
+	logging.getLogger().setLevel(logging.WARNING)
+	result = run_benchmark(
+		args.year, args.rows, seed=args.seed, cache=args.cache, keep_file=args.keep_file, keep_data=args.keep_data,
+		schema=args.schema)
+
+	if args.output is None:
+		json.dump(result, sys.stdout, indent=1)
+		sys.stdout.write("\n")
+	else:
+		with open(args.output, "w") as f:
+			json.dump(result, f, indent=1)
+
+
+if __name__ == "__main__":
+	main()
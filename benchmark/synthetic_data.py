@@ -0,0 +1,121 @@
+import calendar
+import os
+
+import numpy as np
+import pandas as pd
+
+from definitions import ROOT_DIR
+from raw.flight_schema import FILE_COLUMNS
+
+CANCELLATION_CODES = ["A", "B", "C", "D"]
+DELAY_COLUMNS = ["CarrierDelay", "WeatherDelay", "NASDelay", "SecurityDelay", "LateAircraftDelay"]
+
+
+def minutes_to_hhmm(minutes):
+	"""
+		Minutes since midnight (any integer) to HHMM, as in the year files (0000 is written as 2400)
+	"""
+	minutes = np.mod(minutes, 1440)
+	hhmm = (minutes // 60) * 100 + minutes % 60
+
+	return np.where(hhmm == 0, 2400, hhmm)
+
+
+def skewed_choice(rng, values, size):
+	"""
+		Random values where the first ones are more frequent (Zipf like), e.g. big airports and carriers
+	"""
+	weights = 1.0 / np.arange(1, len(values) + 1)
+
+	return np.asarray(values)[rng.choice(len(values), size=size, p=weights / weights.sum())]
+
+
+def generate_flights(year, rows, carriers=20, airports=300, tails=7000, flight_numbers=7000, seed=0):
+	"""
+		Synthetic flights of a year with the columns and the formats of the Data Expo 2009 files: carrier and airport
+		codes of raw/carriers.csv and raw/airports.csv, about 2% cancelled (with a code) and 0.2% diverted flights
+		and the delay causes only for arrivals 15 minutes late.
+	:param year: Year of the data
+	:param rows: Number of flights
+	:param carriers: Number of carrier codes
+	:param airports: Number of airports
+	:param tails: Number of tail numbers
+	:param flight_numbers: Number of flight numbers
+	:param seed: Random seed (the same parameters always generate the same file)
+	:return: Dataframe (FILE_COLUMNS)
+	"""
+	rng = np.random.RandomState(seed)
+
+	carrier_codes = pd.read_csv(os.path.join(ROOT_DIR, "raw", "carriers.csv"))["Code"].dropna()
+	airport_codes = pd.read_csv(os.path.join(ROOT_DIR, "raw", "airports.csv"))["iata"].dropna()
+	carrier_codes = rng.choice(carrier_codes.values, size=min(carriers, len(carrier_codes)), replace=False)
+	airport_codes = rng.choice(airport_codes.values, size=min(airports, len(airport_codes)), replace=False)
+	tail_numbers = np.array(["N{:04d}{}".format(i, chr(65 + i % 26)) for i in rng.permutation(tails)])
+
+	days = np.sort(rng.randint(0, 366 if calendar.isleap(year) else 365, rows))
+	dates = pd.DatetimeIndex(pd.Timestamp(year=year, month=1, day=1) + pd.to_timedelta(days, unit="D"))
+
+	origin = np.minimum(np.floor(rng.pareto(1.2, rows) * 10).astype(int), len(airport_codes) - 1)
+	dest = (origin + 1 + rng.randint(0, len(airport_codes) - 1, rows)) % len(airport_codes)
+	# the same distance for every flight of a route
+	distance = 100 + (origin * 7919 + dest * 104729) % 2600
+
+	scheduled_departure = rng.randint(300, 1410, rows)
+	elapsed = 30 + distance // 8 + rng.randint(-10, 20, rows)
+	departure_delay = np.round(rng.gamma(0.6, 25, rows) - 8).astype(int)
+	arrival_delay = departure_delay + rng.randint(-15, 15, rows)
+	taxi_out = rng.randint(5, 35, rows)
+	taxi_in = rng.randint(2, 20, rows)
+
+	df = pd.DataFrame({
+		"Year": year,
+		"Month": dates.month,
+		"DayofMonth": dates.day,
+		"DayOfWeek": dates.dayofweek + 1,
+		"DepTime": minutes_to_hhmm(scheduled_departure + departure_delay).astype(float),
+		"CRSDepTime": minutes_to_hhmm(scheduled_departure),
+		"ArrTime": minutes_to_hhmm(scheduled_departure + departure_delay + elapsed).astype(float),
+		"CRSArrTime": minutes_to_hhmm(scheduled_departure + elapsed),
+		"UniqueCarrier": skewed_choice(rng, carrier_codes, rows),
+		"FlightNum": rng.randint(1, flight_numbers + 1, rows),
+		"TailNum": tail_numbers[rng.randint(0, tails, rows)],
+		"ActualElapsedTime": (elapsed + arrival_delay - departure_delay).astype(float),
+		"CRSElapsedTime": elapsed.astype(float),
+		"AirTime": np.maximum(elapsed + arrival_delay - departure_delay - taxi_in - taxi_out, 10).astype(float),
+		"ArrDelay": arrival_delay.astype(float),
+		"DepDelay": departure_delay.astype(float),
+		"Origin": airport_codes[origin],
+		"Dest": airport_codes[dest],
+		"Distance": distance,
+		"TaxiIn": taxi_in.astype(float),
+		"TaxiOut": taxi_out.astype(float),
+		"Cancelled": (rng.random_sample(rows) < 0.02).astype(int),
+		"CancellationCode": None,
+		"Diverted": 0,
+	}, columns=FILE_COLUMNS[:24])
+
+	late = (df["ArrDelay"] >= 15).values
+	shares = rng.dirichlet(np.ones(len(DELAY_COLUMNS)), rows)
+	for i, col in enumerate(DELAY_COLUMNS):
+		df[col] = np.where(late, np.floor(shares[:, i] * arrival_delay), np.nan)
+
+	cancelled = df["Cancelled"].values == 1
+	df.loc[cancelled, "CancellationCode"] = rng.choice(CANCELLATION_CODES, size=int(cancelled.sum()))
+	df.loc[~cancelled, "Diverted"] = (rng.random_sample(int((~cancelled).sum())) < 0.002).astype(int)
+	diverted = df["Diverted"].values == 1
+
+	no_departure = ["DepTime", "ArrTime", "ActualElapsedTime", "AirTime", "ArrDelay", "DepDelay", "TaxiIn", "TaxiOut"]
+	df.loc[cancelled, no_departure + DELAY_COLUMNS] = np.nan
+	df.loc[diverted, ["ArrTime", "ActualElapsedTime", "AirTime", "ArrDelay", "TaxiIn"] + DELAY_COLUMNS] = np.nan
+
+	return df[FILE_COLUMNS]
+
+
+def write_year_file(df, file_path):
+	"""
+		Writes a synthetic year as a bz2 csv file (NA for the missing values, as in the Data Expo files)
+	"""
+	os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+	df.to_csv(file_path, index=False, na_rep="NA", float_format="%.0f", compression="bz2")
+
+	return file_path
@@ -30,8 +30,20 @@ CREATE TABLE date_dimension (
     CONSTRAINT date_dimension_pk PRIMARY KEY (sk_date)
 );
 
+-- Table: fact_load_state
+CREATE TABLE fact_load_state (
+    year int  NOT NULL,
+    chunk_index int  NOT NULL,
+    row_offset bigint  NOT NULL,
+    row_count int  NOT NULL,
+    loaded_at timestamp  NOT NULL DEFAULT now(),
+    CONSTRAINT fact_load_state_pk PRIMARY KEY (year,row_offset)
+);
+
 -- Table: flight_arrival_fact
+-- Partitioned by year: the partition of each year (flight_arrival_fact_[year]) is created by the loader
 CREATE TABLE flight_arrival_fact (
+    year int  NOT NULL,
     sk_flight int  NOT NULL,
     sk_date int  NULL,
     sk_carrier int  NULL,
@@ -54,7 +66,7 @@ CREATE TABLE flight_arrival_fact (
     nas_delay int  NULL,
     security_delay int  NULL,
     late_aircraft_delay int  NULL
-);
+) PARTITION BY LIST (year);
 
 -- Table: flight_dimension
 CREATE TABLE flight_dimension (
@@ -85,6 +97,84 @@ CREATE TABLE travel_dimension (
     CONSTRAINT travel_dimension_pk PRIMARY KEY (sk_travel)
 );
 
+-- Summary tables: maintained by the fact loader, with the flights and the delay sums (minutes) of each year
+-- Table: flight_summary_carrier
+CREATE TABLE flight_summary_carrier (
+    year int  NOT NULL,
+    sk_carrier int  NOT NULL,
+    flights bigint  NOT NULL,
+    arrival_delay bigint  NOT NULL,
+    departure_delay bigint  NOT NULL,
+    carrier_delay bigint  NOT NULL,
+    weather_delay bigint  NOT NULL,
+    nas_delay bigint  NOT NULL,
+    security_delay bigint  NOT NULL,
+    late_aircraft_delay bigint  NOT NULL,
+    CONSTRAINT flight_summary_carrier_pk PRIMARY KEY (year,sk_carrier)
+);
+
+-- Table: flight_summary_month
+CREATE TABLE flight_summary_month (
+    year int  NOT NULL,
+    month int  NOT NULL,
+    flights bigint  NOT NULL,
+    arrival_delay bigint  NOT NULL,
+    departure_delay bigint  NOT NULL,
+    carrier_delay bigint  NOT NULL,
+    weather_delay bigint  NOT NULL,
+    nas_delay bigint  NOT NULL,
+    security_delay bigint  NOT NULL,
+    late_aircraft_delay bigint  NOT NULL,
+    CONSTRAINT flight_summary_month_pk PRIMARY KEY (year,month)
+);
+
+-- Table: flight_summary_origin
+CREATE TABLE flight_summary_origin (
+    year int  NOT NULL,
+    origin_airport_iata varchar(5)  NOT NULL,
+    flights bigint  NOT NULL,
+    arrival_delay bigint  NOT NULL,
+    departure_delay bigint  NOT NULL,
+    carrier_delay bigint  NOT NULL,
+    weather_delay bigint  NOT NULL,
+    nas_delay bigint  NOT NULL,
+    security_delay bigint  NOT NULL,
+    late_aircraft_delay bigint  NOT NULL,
+    CONSTRAINT flight_summary_origin_pk PRIMARY KEY (year,origin_airport_iata)
+);
+
+-- Table: flight_summary_route
+CREATE TABLE flight_summary_route (
+    year int  NOT NULL,
+    sk_travel int  NOT NULL,
+    flights bigint  NOT NULL,
+    arrival_delay bigint  NOT NULL,
+    departure_delay bigint  NOT NULL,
+    carrier_delay bigint  NOT NULL,
+    weather_delay bigint  NOT NULL,
+    nas_delay bigint  NOT NULL,
+    security_delay bigint  NOT NULL,
+    late_aircraft_delay bigint  NOT NULL,
+    CONSTRAINT flight_summary_route_pk PRIMARY KEY (year,sk_travel)
+);
+
+-- natural keys (unique indexes used by the dimension upsert, nulls are compared as '' or -1)
+CREATE UNIQUE INDEX cancel_dimension_ak ON cancel_dimension (
+    COALESCE(is_cancelled, -1), COALESCE(cancellation_code, ''), COALESCE(reason, '')
+);
+
+CREATE UNIQUE INDEX carrier_dimension_ak ON carrier_dimension (COALESCE(code, ''), COALESCE(description, ''));
+
+CREATE UNIQUE INDEX date_dimension_ak ON date_dimension (
+    COALESCE(year, -1), COALESCE(month, -1), COALESCE(day_of_month, -1), COALESCE(day_of_week, -1)
+);
+
+CREATE UNIQUE INDEX flight_dimension_ak ON flight_dimension (COALESCE(flight_number, -1), COALESCE(tail_number, ''));
+
+CREATE UNIQUE INDEX travel_dimension_ak ON travel_dimension (
+    COALESCE(origin_airport_iata, ''), COALESCE(dest_airport_iata, '')
+);
+
 -- foreign keys
 -- Reference: flight_arrival_fact_cancel_dimension (table: flight_arrival_fact)
 ALTER TABLE flight_arrival_fact ADD CONSTRAINT flight_arrival_fact_cancel_dimension
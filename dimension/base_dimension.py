@@ -1,6 +1,38 @@
+import os
+
+import numpy as np
 import pandas as pd
 
-from util.utils import get_db_client
+from raw.raw_data import CHUNK_SIZE
+from util.key_index import encode_keys, key_values
+from util.pg_schema import get_column_types
+from util.utils import get_db_client, get_dimension_cache, get_metrics
+
+# Saves the dimensions with a server side upsert (see BaseDimension.upsert)
+UPSERT = os.getenv("FL_ARR_DIM_UPSERT", "0") == "1"
+
+
+def get_sk_name(table_name):
+	"""
+		Surrogate key of a dimension: sk_ + table name without the suffix (e.g. travel_dimension -> sk_travel)
+	"""
+	return "sk_{}".format(table_name.replace("_dimension", ""))
+
+
+def get_key_expressions(table_name, columns, alias=None):
+	"""
+		Natural key expressions of the unique index of a dimension (db/sql/FlightArrival_create.sql), where
+		null is compared as '' (text) or -1 (numbers).
+	:param table_name: Dimension table
+	:param columns: Natural key columns
+	:param alias: Table alias of the columns
+	:return: list of sql expressions
+	"""
+	prefix = "" if alias is None else alias + "."
+	return [
+		"COALESCE({}{}, {})".format(prefix, col, "''" if col_type == "text" else "-1")
+		for col, col_type in zip(columns, get_column_types(table_name, columns))
+	]
 
 
 class BaseDimension():
@@ -12,44 +44,220 @@ class BaseDimension():
 			Connects to the target postgres
 		"""
 		self.db_client = get_db_client()
+		self.source_columns = None
+		self.upsert = UPSERT
+		# Keeps the new members in memory instead of saving them (see get_collected)
+		self.collect = False
+		self.__known_keys = None
+		self.__key_columns = None
+		self.__table_key_columns = None
+		self.__collected = {}
 
 	def query_from_db(self):
 		raise NotImplementedError
 
+	def file_to_df(self, chunksize=None):
+		raise NotImplementedError
+
+	def process_chunk(self, df):
+		"""
+			Loads one chunk of the year file (only with the 'source_columns') to the dimension.
+		:param df: Dataframe (chunk)
+		"""
+		raise NotImplementedError
+
+	def run(self):
+		"""
+			Reads the file in chunks of 50000 records and processes each one of them.
+			When the file is shared with other loaders, see raw.raw_scanner.RawDataScanner.
+		"""
+		stage = type(self).__name__
+		df_iter = get_metrics().measure_iter(stage, self.file_to_df(CHUNK_SIZE))
+		for df in df_iter:  # type: pd.DataFrame
+			with get_metrics().measure(stage, "transform", rows=len(df)):
+				self.process_chunk(df)
+
+	def get_known_keys(self, table_columns):
+		"""
+			Set with the keys already on the dimension. The table is queried only at the first call,
+			after that the set is updated by each save.
+			In upsert mode the table is not queried: the set only has the keys already sent by this loader
+			and the database finds out the new ones. The dimension cache of the fact is then filled only with
+			the members returned by the upserts of this process (see DimensionCache.add): a key upserted only by
+			another loader or process is found by the fact lookup after a miss, that reads the whole dimension
+			again (DimensionCache.refresh).
+		:param table_columns: Key columns of the table
+		:return: set of key tuples
+		"""
+		if self.__known_keys is None and self.upsert:
+			self.__known_keys = set()
+		elif self.__known_keys is None:
+			df_db = self.query_from_db()
+			self.__known_keys = set(zip(*[key_values(df_db[col]) for col in table_columns]))
+
+		return self.__known_keys
+
 	def get_only_new_records(self, df, df_columns, table_columns):
-		df_result = pd.merge(
-			left=df,
-			right=self.query_from_db(),
-			how="left",
-			left_on=df_columns,
-			right_on=table_columns,
-			indicator=True,
-			suffixes=('', '_y')
-		).query("_merge == 'left_only'")
+		"""
+			Filters the records whose key is not on the dimension yet.
+			Only the distinct keys of the dataframe are searched in the known keys set.
+		:param df: Dataframe
+		:param df_columns: Key columns of the dataframe
+		:param table_columns: Key columns of the table (same order of df_columns)
+		:return: Dataframe with the new records
+		"""
+		with get_metrics().measure(type(self).__name__, "lookup", rows=len(df)):
+			known_keys = self.get_known_keys(table_columns)
+			self.__key_columns = df_columns
+			self.__table_key_columns = table_columns
 
-		df_result.drop("_merge", axis=1, inplace=True)
+			codes, keys = encode_keys(df, df_columns)
+			is_new = np.array([key not in known_keys for key in keys], dtype=bool)
 
-		return df_result
+			return df[is_new[codes]]
 
 	def save(self, df, table_name, df_columns=None, table_colums=None):
 		"""
-			Save one dataframe to postgres
+			Save one dataframe to postgres (with COPY or, in upsert mode, see 'upsert').
+			After the commit, the new members are added to the known keys and to the dimension cache
+			used by the fact lookups.
 		:param df: Dataframe
 		:return: None
 		"""
+		if self.collect:
+			self.collect_members(df, table_name, df_columns, table_colums)
+			return
+
+		with get_metrics().measure(type(self).__name__, "copy", rows=len(df)) as measure:
+			if self.upsert:
+				df_members = self.upsert_members(df, table_name, df_columns, table_colums)
+			else:
+				conn = self.db_client.get_conn_engine().raw_connection()
+				cur = conn.cursor()
+
+				try:
+					measure.bytes = self.db_client.copy_df_to_table(
+						df=df,
+						table_name=table_name,
+						commit_connection=conn,
+						columns=table_colums,
+						df_columns=df_columns,
+						cursor=cur,
+						index=False
+					)
+				finally:
+					if not conn.closed:
+						conn.close()
+
+		if self.__known_keys is not None and self.__key_columns is not None:
+			self.__known_keys.update(zip(*[key_values(df[col]) for col in self.__key_columns]))
+
+		if self.upsert:
+			get_dimension_cache().add(table_name, df_members)
+		else:
+			get_dimension_cache().update(table_name)
+
+	def collect_members(self, df, table_name, df_columns, table_colums):
+		"""
+			Keeps the new members (with the table columns) instead of saving them. They are added to the known
+			keys, so each member is collected only once.
+		"""
+		df_columns = list(df_columns if df_columns is not None else df.columns)
+		table_colums = list(table_colums if table_colums is not None else df_columns)
+		df_members = df[df_columns].copy()
+		df_members.columns = table_colums
+		self.__collected.setdefault(table_name, []).append(df_members)
+
+		if self.__known_keys is not None and self.__key_columns is not None:
+			self.__known_keys.update(zip(*[key_values(df[col]) for col in self.__key_columns]))
+
+	def get_collected(self):
+		"""
+			Members collected by save (collect=True), e.g. by a process that only discovers the members of a year
+		:return: dict - table name -> (dataframe with the table columns, natural key columns)
+		"""
+		return {
+			table_name: (
+				pd.concat(dfs, ignore_index=True), list(self.__table_key_columns or dfs[0].columns))
+			for table_name, dfs in self.__collected.items()
+		}
+
+	def save_members(self, df, table_name, key_columns):
+		"""
+			Saves the members collected by other loaders (e.g. of several years, see get_collected): the first
+			member of each key is kept and only the keys not on the dimension yet are saved.
+		:param df: Dataframe with the table columns
+		:param table_name: Dimension table
+		:param key_columns: Natural key columns
+		:return: Number of members saved
+		"""
+		df = df.drop_duplicates(subset=key_columns)
+		df_result = self.get_only_new_records(df=df, df_columns=key_columns, table_columns=key_columns)
+		if len(df_result) > 0:
+			self.save(df=df_result, table_name=table_name, df_columns=list(df.columns), table_colums=list(df.columns))
+
+		return len(df_result)
+
+	def upsert_members(self, df, table_name, df_columns, table_colums):
+		"""
+			Upsert of the candidate members: they are copied to a temporary staging table and inserted with
+			one INSERT ... ON CONFLICT DO NOTHING against the unique index of the natural key.
+			The same statement returns the surrogate key of every candidate, the inserted ones (RETURNING)
+			and the ones already on the dimension (so the fact lookup does not need to read the table).
+		:param df: Candidate members
+		:param table_name: Dimension table
+		:param df_columns: Columns of the dataframe
+		:param table_colums: Columns of the table (same order of df_columns)
+		:return: Dataframe with the sk and the table columns of each candidate key
+		"""
+		table_colums = list(table_colums if table_colums is not None else df.columns)
+		key_columns = self.__table_key_columns or table_colums
+		sk_name = get_sk_name(table_name)
+		staging = "{}_stage".format(table_name)
+
 		conn = self.db_client.get_conn_engine().raw_connection()
 		cur = conn.cursor()
 
 		try:
-			self.db_client.copy_df_to_table(
+			cur.execute("CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA".format(
+				staging, ", ".join(table_colums), table_name))
+			nbytes = self.db_client.copy_df_to_table(
 				df=df,
-				table_name=table_name,
-				commit_connection=conn,
+				table_name=staging,
 				columns=table_colums,
 				df_columns=df_columns,
 				cursor=cur,
 				index=False
 			)
+			get_metrics().add_bytes(nbytes)
+			cur.execute(
+				"""
+					WITH inserted AS (
+						INSERT INTO {table} ({columns})
+						SELECT DISTINCT ON ({keys}) {columns} FROM {staging}
+						ON CONFLICT ({keys}) DO NOTHING
+						RETURNING {sk}, {columns}
+					)
+					SELECT {sk}, {columns} FROM inserted
+					UNION ALL
+					SELECT {table_columns} FROM {table} t JOIN {staging} s ON ({join})
+				""".format(
+					table=table_name,
+					staging=staging,
+					sk=sk_name,
+					columns=", ".join(table_colums),
+					table_columns=", ".join("t." + col for col in [sk_name] + table_colums),
+					keys=", ".join(get_key_expressions(table_name, key_columns)),
+					join=" AND ".join(
+						"{} = {}".format(t, s) for t, s in zip(
+							get_key_expressions(table_name, key_columns, "t"),
+							get_key_expressions(table_name, key_columns, "s")))
+				)
+			)
+			df_members = pd.DataFrame(cur.fetchall(), columns=[sk_name] + table_colums)
+			conn.commit()
 		finally:
 			if not conn.closed:
-				conn.close()
\ No newline at end of file
+				conn.close()
+
+		return df_members.drop_duplicates(subset=[sk_name])
@@ -1,24 +1,34 @@
 import os
-from definitions import ROOT_DIR
 import pandas as pd
 
 from dimension.base_dimension import BaseDimension
-from util.utils import get_db_client
+from raw.raw_data import read_flight_arrival_data
+
+CANCELLATION_REASONS = {
+	"A": "Carrier",
+	"B": "Weather",
+	"C": "NAS",
+	"D": "Security"
+}
 
 
 class CancelDimension(BaseDimension):
 	"""
 		Loads data to the cancel dimension.
-		The data source is a file in raw/[year].csv.bz2
+		The data source is a file in raw/[year].csv.bz2 or, with 'static', the precomputed combinations of
+		the cancelled flag and the cancellation codes.
 	"""
 
-	def __init__(self, year):
+	def __init__(self, year, static=False):
 		"""
 			Connects to the target postgres
 		:param year: Year of the data
+		:param static: Loads all the flag/code combinations instead of reading the year file
 		"""
 		super().__init__()
 		self.year = year
+		self.static = static
+		self.source_columns = ["Cancelled", "CancellationCode"]
 		self.file_columns = ["Cancelled", "CancellationCode", "reason"]
 		self.table_columns = ["is_cancelled", "cancellation_code", "reason"]
 
@@ -44,72 +54,66 @@ class CancelDimension(BaseDimension):
 		:param chunksize: It is used to avoid loading all the file in memory
 		:return: dataframe
 		"""
-		df = pd.read_csv(
-			filepath_or_buffer=os.path.join(ROOT_DIR, "raw", "{}.csv.bz2".format(self.year)),
-			sep=",", compression="bz2", encoding="utf-8", usecols=["Cancelled", "CancellationCode"],
-			chunksize=chunksize
-		)
+		return read_flight_arrival_data(self.year, usecols=self.source_columns, chunksize=chunksize)
 
-		return df
+	def static_to_df(self):
+		"""
+			All the combinations of cancelled flag and cancellation code (including no code),
+			with the same columns of the year file.
+		:return: dataframe
+		"""
+		codes = [None] + sorted(CANCELLATION_REASONS.keys())
+
+		return pd.DataFrame(
+			data=[(cancelled, code) for cancelled in [0, 1] for code in codes],
+			columns=self.source_columns
+		)
 
 	@staticmethod
 	def transform(df: pd.DataFrame):
 		"""
-			Creates a new column called 'reason', translating the CancellationCode
+			Creates a new column called 'reason', translating the CancellationCode.
+			Unknown and null codes (None or NaN) are translated to 'N/A'.
 		:param df: dataframe
 		:return: dataframe transformed
 		"""
-
-		def cancellation_code_to_reason(code):
-			if code is None:
-				return 'N/A'
-			if code == "A":
-				return "Carrier"
-			if code == "B":
-				return "Weather"
-			if code == "C":
-				return "NAS"
-			if code == "D":
-				return "Security"
-			return 'N/A'
-
-		reason_list = []
-		for _, row in df.iterrows():
-			reason_list.append(
-				cancellation_code_to_reason(code=row["CancellationCode"])
-			)
-
-		df["reason"] = reason_list
+		df["reason"] = df["CancellationCode"].astype(object).map(CANCELLATION_REASONS).fillna("N/A")
 
 		return df
 
-	def run(self):
+	def process_chunk(self, df):
 		"""
-			Reads the file in chunks of 50000 records.
-			To each chunk, the duplicate records are removed and the transform method is applied.
+			The duplicate records of the chunk are removed and the transform method is applied.
 			After that, only the new records (not already on database) are saved
-		:return:
+		:param df: Dataframe (chunk)
 		"""
-		df_iter = self.file_to_df(50000)
-		for df in df_iter:  # type: pd.DataFrame
-			df.drop_duplicates(inplace=True)
-			df = self.transform(df)
+		df.drop_duplicates(inplace=True)
+		df = self.transform(df)
+
+		df_result = self.get_only_new_records(
+			df=df,
+			df_columns=self.file_columns,
+			table_columns=self.table_columns
+		)
 
-			df_result = self.get_only_new_records(
-				df=df,
+		if len(df_result) > 0:
+			# df_result.drop(self.table_columns, axis=1, inplace=True)
+
+			self.save(
+				df=df_result,
+				table_name="cancel_dimension",
 				df_columns=self.file_columns,
-				table_columns=self.table_columns
+				table_colums=self.table_columns
 			)
 
-			if len(df_result) > 0:
-				# df_result.drop(self.table_columns, axis=1, inplace=True)
-
-				self.save(
-					df=df_result,
-					table_name="cancel_dimension",
-					df_columns=self.file_columns,
-					table_colums=self.table_columns
-				)
+	def run(self):
+		"""
+			Loads the static combinations (static) or reads the year file in chunks.
+		"""
+		if self.static:
+			self.process_chunk(self.static_to_df())
+		else:
+			super().run()
 
 
 if __name__ == "__main__":
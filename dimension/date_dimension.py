@@ -1,25 +1,27 @@
-import os
-from definitions import ROOT_DIR
 import pandas as pd
-from datetime import date
 
 from dimension.base_dimension import BaseDimension
+from raw.raw_data import read_flight_arrival_data
 from util.utils import get_db_client
 
 
 class DateDimension(BaseDimension):
 	"""
 		Loads data to the date dimension.
-		The data source is a file in raw/[year].csv.bz2
+		The data source is a file in raw/[year].csv.bz2 or, with 'from_calendar', the calendar of the year
+		(a year has at most 366 dates, so there is no need to read the file to find them).
 	"""
 
-	def __init__(self, year):
+	def __init__(self, year, from_calendar=False):
 		"""
 			Connects to the target postgres
 		:param year: Year of the data
+		:param from_calendar: Generates all the dates of the year instead of reading the year file
 		"""
 		super().__init__()
 		self.year = year
+		self.from_calendar = from_calendar
+		self.source_columns = ["Year", "Month", "DayofMonth", "DayOfWeek"]
 		self.file_columns = ["Year", "Month", "DayofMonth", "DayOfWeek"]
 		self.table_columns = ["year", "month", "day_of_month", "day_of_week"]
 		self.db_client = get_db_client()
@@ -45,13 +47,25 @@ class DateDimension(BaseDimension):
 			Only the necessary columns are read.
 		:return: dataframe
 		"""
-		df = pd.read_csv(
-			filepath_or_buffer=os.path.join(ROOT_DIR, "raw", "{}.csv.bz2".format(self.year)),
-			sep=",", compression="bz2", encoding="utf-8", usecols=["Year", "Month", "DayofMonth", "DayOfWeek"],
-			chunksize=chunksize
-		)
+		return read_flight_arrival_data(self.year, usecols=self.source_columns, chunksize=chunksize)
 
-		return df
+	def calendar_to_df(self):
+		"""
+			All the dates of the year, with the same columns of the year file.
+			DayOfWeek follows the file: 1 (Monday) to 7 (Sunday).
+		:return: dataframe
+		"""
+		dates = pd.date_range(start="{}-01-01".format(self.year), end="{}-12-31".format(self.year), freq="D")
+
+		return pd.DataFrame(
+			data={
+				"Year": dates.year,
+				"Month": dates.month,
+				"DayofMonth": dates.day,
+				"DayOfWeek": dates.dayofweek + 1
+			},
+			columns=self.file_columns
+		)
 
 	def transform(self, df):
 		"""
@@ -59,44 +73,43 @@ class DateDimension(BaseDimension):
 		:param df: Dataframe
 		:return: Dataframe with new column
 		"""
-
-		full_date_list = []
-		for _, row in df.iterrows():
-			full_date_list.append(
-				date(year=row["Year"], month=row["Month"], day=row["DayofMonth"])
-			)
-
-		df["full_date"] = full_date_list
+		df["full_date"] = pd.to_datetime(
+			pd.DataFrame({"year": df["Year"], "month": df["Month"], "day": df["DayofMonth"]})
+		)
 
 		return df
 
-	def run(self):
+	def process_chunk(self, df):
 		"""
-			Reads the file in chunks of 50000 records.
-			To each chunk, the duplicate records are removed and the transform method is applied.
+			The duplicate records of the chunk are removed and the transform method is applied.
 			After that, only the new records (not already on database) are saved
-		:return:
+		:param df: Dataframe (chunk)
 		"""
-		df_iter = self.file_to_df(50000)
-		for df in df_iter:  # type: pd.DataFrame
-			df.drop_duplicates(subset=self.file_columns, inplace=True)
-			df = self.transform(df)
-
-			df_result = self.get_only_new_records(
-				df=df,
-				df_columns=self.file_columns,
-				table_columns=self.table_columns
-			)
+		df.drop_duplicates(subset=self.file_columns, inplace=True)
+		df = self.transform(df)
 
-			if len(df_result) > 0:
-				df_result.drop(["year", "month", "day_of_month", "day_of_week"], axis=1)
+		df_result = self.get_only_new_records(
+			df=df,
+			df_columns=self.file_columns,
+			table_columns=self.table_columns
+		)
 
-				self.save(
-					df=df_result,
-					table_name="date_dimension",
-					df_columns=self.file_columns + ["full_date"],
-					table_colums=self.table_columns
-				)
+		if len(df_result) > 0:
+			self.save(
+				df=df_result,
+				table_name="date_dimension",
+				df_columns=self.file_columns + ["full_date"],
+				table_colums=self.table_columns + ["full_date"]
+			)
+
+	def run(self):
+		"""
+			Loads the calendar of the year (from_calendar) or reads the year file in chunks.
+		"""
+		if self.from_calendar:
+			self.process_chunk(self.calendar_to_df())
+		else:
+			super().run()
 
 
 if __name__ == "__main__":
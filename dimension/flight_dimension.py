@@ -1,8 +1,7 @@
-import os
-from definitions import ROOT_DIR
 import pandas as pd
 
 from dimension.base_dimension import BaseDimension
+from raw.raw_data import read_flight_arrival_data
 from util.utils import get_db_client
 
 
@@ -20,6 +19,7 @@ class FlightDimension(BaseDimension):
 		super().__init__()
 		self.year = year
 		self.db_client = get_db_client()
+		self.source_columns = ["FlightNum", "TailNum"]
 		self.file_columns = ["FlightNum", "TailNum"]
 		self.table_columns = ["flight_number", "tail_number"]
 
@@ -37,25 +37,21 @@ class FlightDimension(BaseDimension):
 			con=self.db_client.get_conn_engine()
 		)
 
-	def file_to_df(self):
+	def file_to_df(self, chunksize=None):
 		"""
 			Read the data file of the year (already downloaded) and returns into
 			in a pandas dataframe.
 			Only the necessary columns are read.
+		:param chunksize: It is used to avoid loading all the file in memory
 		:return: dataframe
 		"""
-		df = pd.read_csv(
-			filepath_or_buffer=os.path.join(ROOT_DIR, "raw", "{}.csv.bz2".format(self.year)),
-			sep=",", compression="bz2", encoding="utf-8", usecols=["FlightNum", "TailNum"])
+		return read_flight_arrival_data(self.year, usecols=self.source_columns, chunksize=chunksize)
 
-		return df
-
-	def run(self):
+	def process_chunk(self, df):
 		"""
-			Reads the file, drop the duplicates and saves to the db only the new records
-		:return:
+			Drop the duplicates of the chunk and saves to the db only the new records
+		:param df: Dataframe (chunk)
 		"""
-		df = self.file_to_df()
 		df.drop_duplicates(inplace=True)
 
 		df_result = self.get_only_new_records(
@@ -65,8 +61,6 @@ class FlightDimension(BaseDimension):
 		)
 
 		if len(df_result) > 0:
-			df_result.drop(self.table_columns, axis=1)
-
 			self.save(
 				df=df_result,
 				table_name="flight_dimension",
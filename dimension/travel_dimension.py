@@ -3,6 +3,7 @@ from definitions import ROOT_DIR
 import pandas as pd
 
 from dimension.base_dimension import BaseDimension
+from raw.raw_data import read_flight_arrival_data
 from util.utils import get_db_client
 
 
@@ -20,6 +21,7 @@ class TravelDimension(BaseDimension):
 		super().__init__()
 		self.year = year
 		self.db_client = get_db_client()
+		self.source_columns = ["Origin", "Dest", "Distance"]
 		self.table_columns = [
 			'distance', 'origin_airport_iata', 'origin_airport_name', 'origin_city',
 			'origin_state', 'origin_country', 'origin_latitude', 'origin_longitude',
@@ -28,6 +30,7 @@ class TravelDimension(BaseDimension):
 		self.join_columns = [
 			"origin_airport_iata", "dest_airport_iata"
 		]
+		self.df_airport = None
 
 	def query_from_db(self):
 		"""
@@ -49,13 +52,7 @@ class TravelDimension(BaseDimension):
 		:param chunksize: Number of records of the chunk
 		:return: Dataframe.
 		"""
-		df = pd.read_csv(
-			filepath_or_buffer=os.path.join(ROOT_DIR, "raw", "{}.csv.bz2".format(self.year)),
-			sep=",", compression="bz2", encoding="utf-8", usecols=["Origin", "Dest", "Distance"],
-			chunksize=chunksize
-		)
-
-		return df
+		return read_flight_arrival_data(self.year, usecols=self.source_columns, chunksize=chunksize)
 
 	def airport_file_to_df(self):
 		"""
@@ -121,32 +118,39 @@ class TravelDimension(BaseDimension):
 
 		return df_res
 
-	def run(self):
+	def get_airport_df(self):
 		"""
-			Reads both year data and airport data. Drop duplicates and save only new records.
-		:return:
+			The airport file is small, so it is read only once (at the first chunk)
+		:return: Dataframe
 		"""
-		df_iter = self.file_to_df(50000)
-		df_airport = self.airport_file_to_df()
-		for df in df_iter:  # type: pd.DataFrame
-			df.drop_duplicates(inplace=True)
-			df = self.transform(df, df_airport)
-
-			df_result = self.get_only_new_records(
-				df=df,
-				df_columns=self.join_columns,
-				table_columns=self.join_columns
-			)
+		if self.df_airport is None:
+			self.df_airport = self.airport_file_to_df()
 
-			if len(df_result) > 0:
-				# df_result.drop(self.table_columns, axis=1)
+		return self.df_airport
 
-				self.save(
-					df=df_result,
-					table_name="travel_dimension",
-					df_columns=self.table_columns,
-					table_colums=self.table_columns
-				)
+	def process_chunk(self, df):
+		"""
+			Adds the airport data to the chunk. Drop duplicates and save only new records.
+		:param df: Dataframe (chunk)
+		"""
+		df.drop_duplicates(inplace=True)
+		df = self.transform(df, self.get_airport_df())
+
+		df_result = self.get_only_new_records(
+			df=df,
+			df_columns=self.join_columns,
+			table_columns=self.join_columns
+		)
+
+		if len(df_result) > 0:
+			# df_result.drop(self.table_columns, axis=1)
+
+			self.save(
+				df=df_result,
+				table_name="travel_dimension",
+				df_columns=self.table_columns,
+				table_colums=self.table_columns
+			)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+from bisect import bisect_right
+from collections import deque
+import logging
+
+import pandas as pd
+
+from util.utils import get_db_client
+
+
+class FactLoadState:
+	"""
+		Checkpoints of the fact load (table fact_load_state): one record per committed chunk of the year file,
+		with its position (row_offset) and size (row_count). The record is written in the same transaction
+		as the COPY of the chunk, so a chunk is either loaded and recorded or not loaded at all.
+
+		A restarted load reads the file from the end of the committed chunks (get_resume_row) and skips
+		any chunk committed after it (e.g. by another connection of the writer pool). Only the cache seeks to the
+		resume row, the csv readers still parse the rows before it (see raw.raw_data.read_csv_data).
+		The chunks must be read in the file order and with the same size of the interrupted load (the readers of
+		raw.raw_data yield chunks of CHUNK_SIZE records, except the out of order parallel reader).
+	"""
+
+	def __init__(self, year, table_name="fact_load_state"):
+		"""
+		:param year: Year of the data
+		:param table_name: State table
+		"""
+		self.year = int(year)
+		self.table_name = table_name
+		self.db_client = get_db_client()
+		self.__loaded = None
+		self.__pending = deque()
+
+	def query_from_db(self):
+		return pd.read_sql_query(
+			sql="SELECT chunk_index, row_offset, row_count FROM {} WHERE year = %(year)s ORDER BY row_offset".format(
+				self.table_name),
+			con=self.db_client.get_conn_engine(),
+			params={"year": self.year}
+		)
+
+	def get_loaded_chunks(self):
+		"""
+			Chunks committed by the previous loads (read once)
+		:return: dict - row_offset -> (chunk_index, row_count)
+		"""
+		if self.__loaded is None:
+			df = self.query_from_db()
+			self.__loaded = {
+				offset: (index, count)
+				for index, offset, count in zip(df["chunk_index"], df["row_offset"], df["row_count"])
+			}
+
+		return self.__loaded
+
+	def get_resume_point(self):
+		"""
+			End of the chunks committed with all the previous ones also committed.
+		:return: (row, chunk index) where the load must restart
+		"""
+		loaded = self.get_loaded_chunks()
+		row, chunk_index = 0, 0
+		while row in loaded:
+			row += int(loaded[row][1])
+			chunk_index += 1
+
+		return row, chunk_index
+
+	def get_resume_row(self):
+		return self.get_resume_point()[0]
+
+	def iter_new_chunks(self, df_iter, first_row=0, skip_loaded=True):
+		"""
+			Numbers the chunks of the file and yields only the chunks not committed yet.
+			The position of each chunk yielded is queued to be recorded by 'record' (in the same order).
+		:param df_iter: Dataframe iterator, starting at the row 'first_row' of the file
+		:param first_row: Position of the first chunk (e.g. the resume row)
+		:param skip_loaded: False yields all the chunks (full reload)
+		:return: Dataframe iterator
+		"""
+		loaded = self.get_loaded_chunks() if skip_loaded else {}
+		resume_row, resume_index = self.get_resume_point() if skip_loaded else (0, 0)
+		if first_row not in (0, resume_row):
+			raise ValueError("The load of {} must start at the row 0 or {}, not {}".format(
+				self.year, resume_row, first_row))
+
+		offsets = sorted(loaded.keys())
+		row, chunk_index = first_row, resume_index if first_row == resume_row else 0
+		skipped = 0
+		for df in df_iter:  # type: pd.DataFrame
+			chunk = (chunk_index, row, len(df))
+			row += len(df)
+			chunk_index += 1
+
+			if chunk[1] in loaded and loaded[chunk[1]][1] == chunk[2]:
+				skipped += 1
+				continue
+			if self.overlaps(offsets, chunk[1], row):
+				raise ValueError(
+					"Chunk at rows {}-{} of {} overlaps a chunk already loaded. The chunk size must not change "
+					"between a load and its restart".format(chunk[1], row - 1, self.year))
+
+			self.__pending.append(chunk)
+			yield df
+
+		if skipped > 0:
+			logging.info("FactLoadState - {} - {} chunks already loaded were skipped".format(self.year, skipped))
+
+	def overlaps(self, offsets, start, end):
+		"""
+			Checks if the rows [start, end) have any row of a loaded chunk
+		:param offsets: Sorted offsets of the loaded chunks
+		"""
+		i = bisect_right(offsets, start)
+		if i > 0 and offsets[i - 1] + self.get_loaded_chunks()[offsets[i - 1]][1] > start:
+			return True
+
+		return i < len(offsets) and offsets[i] < end
+
+	def next_chunk(self):
+		"""
+			Position of the next chunk to be written (chunks are written in the order they were yielded)
+		:return: (chunk_index, row_offset, row_count)
+		"""
+		return self.__pending.popleft()
+
+	def record(self, cursor, chunk):
+		"""
+			Records a chunk, with the cursor (and transaction) of its COPY.
+		:param cursor: Cursor
+		:param chunk: (chunk_index, row_offset, row_count)
+		"""
+		cursor.execute(
+			"INSERT INTO {} (year, chunk_index, row_offset, row_count) VALUES (%s, %s, %s, %s)".format(
+				self.table_name),
+			(self.year, int(chunk[0]), int(chunk[1]), int(chunk[2]))
+		)
+
+	def delete(self, cursor):
+		"""
+			Deletes the state of the year (for a full reload)
+		"""
+		cursor.execute("DELETE FROM {} WHERE year = %s".format(self.table_name), (self.year,))
+		self.__loaded = {}
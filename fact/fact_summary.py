@@ -0,0 +1,135 @@
+import pandas as pd
+
+from util.utils import get_db_client
+
+# Delay columns of the fact summed by the summary tables (minutes)
+MEASURES = [
+	"arrival_delay", "departure_delay", "carrier_delay", "weather_delay", "nas_delay", "security_delay",
+	"late_aircraft_delay"
+]
+
+# Summary table -> (surrogate key of the fact, key column of the summary, dimension of the key column).
+# Without a dimension, the key column is the surrogate key itself.
+SUMMARIES = [
+	("flight_summary_month", "sk_date", "month", "date_dimension"),
+	("flight_summary_origin", "sk_travel", "origin_airport_iata", "travel_dimension"),
+	("flight_summary_carrier", "sk_carrier", "sk_carrier", None),
+	("flight_summary_route", "sk_travel", "sk_travel", None)
+]
+
+
+class FactSummary:
+	"""
+		Summary tables of the fact (flight_summary_*): flights and delay sums per year and month, origin
+		airport, carrier and route, read by the report notebook instead of the fact.
+
+		The summaries of a chunk are added in the same transaction as its COPY (see update), so they always
+		match the committed chunks, also after a restart. A swapped partition has its summaries computed
+		again from the whole partition (see rebuild).
+		The chunk updates lock the summary rows until the commit, so concurrent writers wait for each other
+		only at the end of their transactions (the rows are always locked in the same order).
+	"""
+
+	def __init__(self, year, stage_table="fact_summary_stage"):
+		"""
+		:param year: Year of the data
+		:param stage_table: Temporary table with the sums of a chunk
+		"""
+		self.year = int(year)
+		self.stage_table = stage_table
+		self.db_client = get_db_client()
+
+	@staticmethod
+	def get_key_sql(sk_name, key, dimension, alias, sk_column):
+		"""
+			Key expression and join of a summary
+		:param sk_column: Column of the source with the surrogate key
+		:return: (key expression, join clause)
+		"""
+		if dimension is None:
+			return "{}.{}".format(alias, sk_column), ""
+
+		return "d.{}".format(key), "JOIN {} d ON d.{} = {}.{}".format(dimension, sk_name, alias, sk_column)
+
+	def sum_chunk(self, df: pd.DataFrame):
+		"""
+			Sums a chunk by each surrogate key of the summaries, in one dataframe:
+			sk_name, sk, flights and the delay sums.
+		:param df: Transformed chunk
+		:return: Dataframe
+		"""
+		sums = []
+		for sk_name in sorted(set(summary[1] for summary in SUMMARIES)):
+			df_sum = df.groupby(sk_name, sort=False)[MEASURES].sum()
+			df_sum.insert(0, "flights", df.groupby(sk_name, sort=False).size())
+			df_sum.index.name = "sk"
+			df_sum = df_sum.reset_index()
+			df_sum.insert(0, "sk_name", sk_name)
+			sums.append(df_sum)
+
+		return pd.concat(sums, ignore_index=True)
+
+	def update(self, cursor, df):
+		"""
+			Adds the flights and the delays of a chunk to the summaries, with the cursor (and transaction)
+			of its COPY.
+		:param cursor: Cursor
+		:param df: Transformed chunk (with the surrogate keys)
+		"""
+		df_sum = self.sum_chunk(df)
+		columns = ["sk_name", "sk", "flights"] + MEASURES
+		cursor.execute(
+			"CREATE TEMP TABLE {} (sk_name varchar(20), sk int, flights bigint, {}) ON COMMIT DROP".format(
+				self.stage_table, ", ".join("{} bigint".format(col) for col in MEASURES))
+		)
+		self.db_client.copy_df_to_table(
+			df=df_sum, table_name=self.stage_table, columns=columns, df_columns=columns, cursor=cursor, index=False)
+
+		for table, sk_name, key, dimension in SUMMARIES:
+			key_expr, join = self.get_key_sql(sk_name, key, dimension, "s", "sk")
+			cursor.execute(
+				"""
+					INSERT INTO {table} (year, {key}, flights, {measures})
+					SELECT %(year)s, {key_expr}, sum(s.flights), {sums}
+					FROM {stage} s {join}
+					WHERE s.sk_name = %(sk_name)s
+					GROUP BY {key_expr}
+					ORDER BY {key_expr}
+					ON CONFLICT (year, {key}) DO UPDATE SET flights = {table}.flights + EXCLUDED.flights, {updates}
+				""".format(
+					table=table, key=key, key_expr=key_expr, join=join, stage=self.stage_table,
+					measures=", ".join(MEASURES), sums=", ".join("sum(s.{})".format(col) for col in MEASURES),
+					updates=", ".join("{col} = {table}.{col} + EXCLUDED.{col}".format(col=col, table=table)
+						for col in MEASURES)
+				),
+				{"year": self.year, "sk_name": sk_name}
+			)
+
+	def delete(self, cursor):
+		"""
+			Deletes the summaries of the year (for a full reload)
+		"""
+		for table, _, _, _ in SUMMARIES:
+			cursor.execute("DELETE FROM {} WHERE year = %s".format(table), (self.year,))
+
+	def rebuild(self, cursor, source_table):
+		"""
+			Replaces the summaries of the year with the sums of a whole table (one query per summary).
+		:param cursor: Cursor
+		:param source_table: Fact partition of the year
+		"""
+		self.delete(cursor)
+		for table, sk_name, key, dimension in SUMMARIES:
+			key_expr, join = self.get_key_sql(sk_name, key, dimension, "f", sk_name)
+			cursor.execute(
+				"""
+					INSERT INTO {table} (year, {key}, flights, {measures})
+					SELECT %(year)s, {key_expr}, count(*), {sums}
+					FROM {source} f {join}
+					GROUP BY {key_expr}
+				""".format(
+					table=table, key=key, key_expr=key_expr, join=join, source=source_table,
+					measures=", ".join(MEASURES), sums=", ".join("sum(f.{})".format(col) for col in MEASURES)
+				),
+				{"year": self.year}
+			)
@@ -1,9 +1,16 @@
+import numpy as np
 import pandas as pd
+import re
 import time
-import os
 
-from util.utils import get_db_client, sum_lists_without_duplicates
-from definitions import ROOT_DIR
+from fact.fact_load_state import FactLoadState
+from fact.fact_summary import FactSummary
+from raw.raw_data import read_flight_arrival_data, CHUNK_SIZE
+from util.copy_writer_pool import CopyWriterPool
+from util.key_index import KeyIndex
+from util.pg_schema import get_column_types
+from util.pipeline import ChunkPipeline
+from util.utils import get_db_client, get_dimension_cache, get_metrics
 import logging
 
 
@@ -15,80 +22,305 @@ class FlightArrivalFact():
 	def __init__(self, year):
 		self.year = year
 		self.db_client = get_db_client()
+		self.source_columns = None
+		self.load_state = FactLoadState(year)
+		self.summary = FactSummary(year)
 
-	def file_to_df(self, chunksize=None):
+	def file_to_df(self, chunksize=None, skip_rows=0):
 		"""
 			Load flight arrival to a dataframe
 		:param chunksize: number of records
+		:param skip_rows: number of records skipped at the beginning of the file
 		:return: Dataframe iterator
 		"""
-		df = pd.read_csv(
-			filepath_or_buffer=os.path.join(ROOT_DIR, "raw", "{}.csv.bz2".format(self.year)),
-			sep=",", compression="bz2", encoding="utf-8", chunksize=chunksize
-		)
-
-		return df
+		return read_flight_arrival_data(self.year, chunksize=chunksize, skip_rows=skip_rows)
 
 	def simple_lookup(
 			self, df: pd.DataFrame, dim_table_name: str, df_columns: list, dim_columns: list, sk_name: str = None,
 			dimension_custom_query: str = None, drop_non_sk_after: bool = True):
 		"""
 			Lookup between main dataframe and a dimension, checking if any records were lost.
+			The dimension is read from the process dimension cache (see util.dimension_cache) and the
+			surrogate key is resolved with its hash index, writing the sk column in the same dataframe.
 		:param df: Dataframe
 		:param dim_table_name: Dimension dataframe
 		:param df_columns: Dataframe column list
 		:param dim_columns: Dimension column list
 		:param sk_name: Surrogate key of the dimension
 		:param dimension_custom_query: Custom query (to change the default sql)
-		:param drop_non_sk_after: Indicates if all the columns added, except the sk, should be dropped.
+		:param drop_non_sk_after: Indicates if the dataframe join columns should be dropped.
 		:return:
 		"""
 		start_time = time.time()
 
 		if dimension_custom_query is None:
-			sql = "Select {}, {} from {}".format(sk_name, ", ".join(dim_columns), dim_table_name)
+			index = get_dimension_cache().get(dim_table_name, sk_name, dim_columns)
 		else:
-			sql = dimension_custom_query
+			index = KeyIndex(sk_name, dim_columns)
+			index.add(pd.read_sql_query(sql=dimension_custom_query, con=self.db_client.get_conn_engine()))
 
-		df_dimensao = pd.read_sql_query(sql=sql, con=self.db_client.get_conn_engine())
+		sk_values = index.resolve(df, df_columns)
+		if (sk_values < 0).any() and dimension_custom_query is None:
+			# members loaded by other processes (or not returned by an upsert): reads the dimension again
+			sk_values = get_dimension_cache().refresh(dim_table_name, sk_name, dim_columns).resolve(df, df_columns)
 
-		old_size = len(df)
-		df = df.merge(right=df_dimensao, left_on=df_columns, right_on=dim_columns, how="inner", validate="m:1")
-		if old_size != len(df):
+		missed = int((sk_values < 0).sum())
+		if missed > 0:
 			raise ValueError(
 				"Missed records after dimension {} join. Before: {}, After: {}".format(
-					dim_table_name, old_size, len(df)))
+					dim_table_name, len(df), len(df) - missed))
 
 		if drop_non_sk_after:
-			drop_columns = sum_lists_without_duplicates(df_columns, dim_columns)
-			df.drop(drop_columns, axis=1, inplace=True)
+			df.drop(df_columns, axis=1, inplace=True)
 
-		df[sk_name] = df[sk_name].fillna(0).astype(int)
+		df[sk_name] = sk_values
 
 		elapsed_time = time.time() - start_time
 		logging.info("SimpleLookup - {} - {} s".format(dim_table_name, elapsed_time))
 
 		return df
 
-	def save(self, df):
-		"""Save the table"""
+	@staticmethod
+	def get_copy_params(df, table_name="flight_arrival_fact"):
+		"""
+			Parameters of PostgresClient.copy_df_to_table for one chunk (binary COPY)
+		"""
+		return {
+			"table_name": table_name,
+			"columns": df.columns,
+			"df_columns": df.columns,
+			"index": False,
+			"binary": True,
+			"column_types": get_column_types("flight_arrival_fact", df.columns)
+		}
+
+	def get_partition_name(self):
+		return "flight_arrival_fact_{}".format(int(self.year))
+
+	def execute(self, sql_list):
+		"""
+			Runs a list of statements in one transaction
+		"""
 		conn = self.db_client.get_conn_engine().raw_connection()
 		cur = conn.cursor()
 
 		try:
-			self.db_client.copy_df_to_table(
-				df=df,
-				table_name="flight_arrival_fact",
-				commit_connection=conn,
-				columns=df.columns,
-				df_columns=df.columns,
-				cursor=cur,
-				index=False
-			)
+			for sql in sql_list:
+				cur.execute(sql)
+			conn.commit()
 		finally:
 			if not conn.closed:
 				conn.close()
 
+	def create_partition(self):
+		"""
+			Creates the partition of the year, if it does not exist.
+		"""
+		self.execute([
+			"CREATE TABLE IF NOT EXISTS {} PARTITION OF flight_arrival_fact FOR VALUES IN ({})".format(
+				self.get_partition_name(), int(self.year))
+		])
+
+	def before_commit(self, cursor, df, chunk=None, bulk=False, summarize=True):
+		"""
+			Called after the COPY of a chunk, in the same transaction: records the chunk, adds it to the summary
+			tables (see FactSummary) and, in bulk mode, commits without waiting for the WAL flush
+			(synchronous_commit only matters at the commit).
+		"""
+		if bulk:
+			cursor.execute("SET LOCAL synchronous_commit TO OFF")
+		if chunk is not None:
+			self.load_state.record(cursor, chunk)
+		if summarize:
+			with get_metrics().measure("FlightArrivalFact", "summary", rows=len(df)):
+				self.summary.update(cursor, df)
+
+	def save(self, df, chunk=None, table_name="flight_arrival_fact", bulk=False):
+		"""
+			Save the table
+		:param df: Dataframe (chunk)
+		:param chunk: Position of the chunk in the file (see FactLoadState), recorded in the same transaction
+		:param table_name: Target table (the fact or a staging partition)
+		:param bulk: Bulk load (see run)
+		"""
+		conn = self.db_client.get_conn_engine().raw_connection()
+		cur = conn.cursor()
+
+		try:
+			# the rows of a failed COPY are not counted, only its time
+			with get_metrics().measure("FlightArrivalFact", "copy") as measure:
+				measure.bytes = self.db_client.copy_df_to_table(
+					df=df, cursor=cur, **self.get_copy_params(df, table_name))
+				# the summaries of a staging table are computed when it is swapped
+				self.before_commit(cur, df, chunk, bulk, summarize=table_name == "flight_arrival_fact")
+				conn.commit()
+				measure.rows = len(df)
+		finally:
+			if not conn.closed:
+				conn.close()
+
+	def delete(self):
+		"""
+			Deletes the records of the year (truncating its partition), its load state and its summaries, for a
+			full reload.
+		"""
+		conn = self.db_client.get_conn_engine().raw_connection()
+		cur = conn.cursor()
+
+		try:
+			cur.execute("SELECT to_regclass(%s)", (self.get_partition_name(),))
+			if cur.fetchone()[0] is not None:
+				cur.execute("TRUNCATE TABLE {}".format(self.get_partition_name()))
+				logging.info("FlightArrivalFact - partition {} truncated".format(self.get_partition_name()))
+			self.load_state.delete(cur)
+			self.summary.delete(cur)
+			conn.commit()
+		finally:
+			if not conn.closed:
+				conn.close()
+
+	def log_phase(self, phase, start_time):
+		"""
+			Logs the time of a phase of the load
+		:return: End of the phase (start of the next one)
+		"""
+		end_time = time.time()
+		logging.info("FlightArrivalFact - {} - {:.2f} s".format(phase, end_time - start_time))
+
+		return end_time
+
+	def get_foreign_keys(self):
+		"""
+			Foreign keys of the fact table
+		:return: list of (name, definition)
+		"""
+		df = pd.read_sql_query(
+			sql="""
+				SELECT conname, pg_get_constraintdef(oid) AS definition
+				FROM pg_constraint
+				WHERE conrelid = 'flight_arrival_fact'::regclass AND contype = 'f'
+				ORDER BY conname
+			""",
+			con=self.db_client.get_conn_engine()
+		)
+
+		return list(zip(df["conname"], df["definition"]))
+
+	def get_indexes(self, table_name):
+		"""
+			Secondary indexes of a table (the indexes of constraints are not included)
+		:return: list of (name, definition)
+		"""
+		df = pd.read_sql_query(
+			sql="""
+				SELECT i.indexname, i.indexdef
+				FROM pg_indexes i
+				WHERE i.tablename = %(table_name)s
+				AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)
+				ORDER BY i.indexname
+			""",
+			con=self.db_client.get_conn_engine(),
+			params={"table_name": table_name}
+		)
+
+		return list(zip(df["indexname"], df["indexdef"]))
+
+	def create_staging(self, unlogged=False):
+		"""
+			Creates an empty staging table for the partition of the year: same columns of the fact, without
+			foreign keys or indexes. The check of the year lets ATTACH PARTITION skip the scan of the bound.
+		:param unlogged: Creates an UNLOGGED table (no WAL during the load, see finish_bulk_staging)
+		:return: Staging table name
+		"""
+		staging = "{}_load".format(self.get_partition_name())
+		self.execute([
+			"DROP TABLE IF EXISTS {}".format(staging),
+			"""
+				CREATE {unlogged}TABLE {staging} (
+					LIKE flight_arrival_fact INCLUDING DEFAULTS,
+					CONSTRAINT {partition}_year CHECK (year = {year})
+				)
+			""".format(
+				unlogged="UNLOGGED " if unlogged else "", staging=staging, partition=self.get_partition_name(),
+				year=int(self.year))
+		])
+
+		return staging
+
+	def finish_bulk_staging(self, staging, indexes):
+		"""
+			After a bulk load: makes the staging table logged, builds the indexes of the old partition (with
+			the suffix _load, renamed by swap_partition) and adds the foreign keys of the fact, each one
+			validated by one query over the whole table.
+		:param staging: Staging table, already loaded
+		:param indexes: Indexes of the partition (see get_indexes)
+		"""
+		start_time = time.time()
+		self.execute(["ALTER TABLE {} SET LOGGED".format(staging)])
+		start_time = self.log_phase("bulk - set logged", start_time)
+
+		partition = self.get_partition_name()
+		self.execute([
+			re.sub(
+				r"INDEX {} ON (\w+\.)?{} ".format(name, partition), "INDEX {}_load ON {} ".format(name, staging),
+				definition)
+			for name, definition in indexes
+		])
+		start_time = self.log_phase("bulk - {} indexes".format(len(indexes)), start_time)
+
+		foreign_keys = self.get_foreign_keys()
+		self.execute(
+			["ALTER TABLE {} ADD CONSTRAINT {} {} NOT VALID".format(staging, name, definition)
+				for name, definition in foreign_keys] +
+			["ALTER TABLE {} VALIDATE CONSTRAINT {}".format(staging, name) for name, _ in foreign_keys]
+		)
+		self.log_phase("bulk - {} foreign keys validated".format(len(foreign_keys)), start_time)
+
+	def swap_partition(self, staging, chunks, indexes=()):
+		"""
+			Replaces the partition of the year with the staging table, in one transaction: the row count is
+			checked, the old partition is detached and dropped and the staging is attached in its place
+			(the attach validates the foreign keys of all the rows in one pass, unless the staging already
+			has them validated). The load state of the year is replaced by the chunks of the staging and the
+			summaries of the year are computed again from the new partition.
+		:param staging: Staging table, already loaded
+		:param chunks: Chunks loaded in the staging (see FactLoadState)
+		:param indexes: Indexes built in the staging with the suffix _load (see finish_bulk_staging)
+		"""
+		start_time = time.time()
+		partition = self.get_partition_name()
+		conn = self.db_client.get_conn_engine().raw_connection()
+		cur = conn.cursor()
+
+		try:
+			cur.execute("SELECT count(*) FROM {}".format(staging))
+			rows = cur.fetchone()[0]
+			if rows != sum(chunk[2] for chunk in chunks):
+				raise ValueError("Staging {} has {} records, but {} were loaded".format(
+					staging, rows, sum(chunk[2] for chunk in chunks)))
+
+			cur.execute("SELECT to_regclass(%s)", (partition,))
+			if cur.fetchone()[0] is not None:
+				cur.execute("ALTER TABLE flight_arrival_fact DETACH PARTITION {}".format(partition))
+				cur.execute("DROP TABLE {}".format(partition))
+
+			cur.execute("ALTER TABLE {} RENAME TO {}".format(staging, partition))
+			for name, _ in indexes:
+				cur.execute("ALTER INDEX {}_load RENAME TO {}".format(name, name))
+			cur.execute("ALTER TABLE flight_arrival_fact ATTACH PARTITION {} FOR VALUES IN ({})".format(
+				partition, int(self.year)))
+
+			self.load_state.delete(cur)
+			for chunk in chunks:
+				self.load_state.record(cur, chunk)
+			self.summary.rebuild(cur, partition)
+			conn.commit()
+		finally:
+			if not conn.closed:
+				conn.close()
+
+		self.log_phase("partition {} swapped ({} records)".format(partition, rows), start_time)
+
 	def apply_lookup(self, df):
 		"""
 			Calls all lookups, indicating the join columns
@@ -138,9 +370,34 @@ class FlightArrivalFact():
 
 		return df
 
+	@staticmethod
+	def hhmm_to_seconds(series: pd.Series):
+		"""
+			Converts HHMM integers (e.g. 1435 = 14:35) to seconds since midnight, with integer arithmetic.
+			2400 (end of the day in the source file) is kept as 24:00, a valid postgres time. Missing values (0, as
+			filled by the reader, or NaN) and invalid values (negative, after 2400 or minutes after 59) are loaded
+			as 00:00.
+		:param series: HHMM column
+		:return: numpy array (int32)
+		"""
+		if series.dtype.kind == "f":
+			series = series.fillna(0)
+		values = series.values.astype(np.int32)
+		hours, minutes = np.divmod(values, 100)
+		invalid = (values < 0) | (values > 2400) | (minutes >= 60)
+
+		seconds = hours * 3600 + minutes * 60
+		if invalid.any():
+			logging.warning("{} invalid times in {} loaded as 00:00".format(int(invalid.sum()), series.name))
+			seconds[invalid] = 0
+
+		return seconds
+
 	def transform(self, df):
 		"""
-			Transformations: Rename columns, change columns type and change the format of 'time' columns.
+			Transformations: Rename columns and convert the 'time' columns to seconds since midnight
+			(written as postgres time by the binary COPY).
+			The numeric columns are already integers, with the nulls filled with 0 (see raw.flight_schema).
 		:param df: Dataframe
 		:return: Dataframe transformed
 		"""
@@ -167,30 +424,131 @@ class FlightArrivalFact():
 			}
 		)
 
-		for col in [
-			"actual_departure_time", "scheduled_departure_time", "arrival_time", "scheduled_arrival_time",
-			"actual_elapsed_time", "estimated_elapsed_time", "air_time", "arrival_delay", "departure_delay",
-			"taxi_in_time", "taxi_out_time", "diverted", "carrier_delay", "weather_delay", "nas_delay",
-			"security_delay", "late_aircraft_delay"
-		]:
-			df[col] = df[col].fillna(0).astype(int)
-
 		for col in [
 			"actual_departure_time", "scheduled_departure_time", "arrival_time", "scheduled_arrival_time"
 		]:
-			df[col] = df[col].fillna(0).astype(str)
-			df[col] = df[col].str[0:-2].replace("", "0") + ":" + df[col].str[-2:]
+			df[col] = self.hhmm_to_seconds(df[col])
 
 		df.drop("Distance", axis=1, inplace=True)
+		df["year"] = int(self.year)
 
 		return df
 
-	def run(self):
-		df_iter = self.file_to_df(50000)
-		for df in df_iter:  # type: pd.DataFrame
+	def lookup_and_transform(self, df):
+		"""
+			All the dimensions must already have the chunk records.
+		:param df: Dataframe (chunk)
+		:return: Dataframe ready to be saved
+		"""
+		with get_metrics().measure("FlightArrivalFact", "lookup", rows=len(df)):
 			df = self.apply_lookup(df)
-			df = self.transform(df)
-			self.save(df)
+		with get_metrics().measure("FlightArrivalFact", "transform", rows=len(df)):
+			return self.transform(df)
+
+	def process_chunk(self, df):
+		"""
+			Lookup, transform and save one chunk of the year file.
+		:param df: Dataframe (chunk)
+		"""
+		self.save(self.lookup_and_transform(df))
+
+	def run_chunks(self, df_iter, write, workers=0, queue_depth=4):
+		"""
+			Lookup, transform and write each chunk, serially or as a pipeline (workers > 0).
+		"""
+		if workers > 0:
+			ChunkPipeline(
+				source=df_iter,
+				work=self.lookup_and_transform,
+				write=write,
+				workers=workers,
+				queue_depth=queue_depth,
+				name="FlightArrivalFact"
+			).run()
+		else:
+			for df in df_iter:  # type: pd.DataFrame
+				write(self.lookup_and_transform(df))
+
+	def run(self, df_iter=None, workers=0, queue_depth=4, writers=0, first_row=0, swap=False, bulk=False):
+		"""
+			Loads the year file (or the informed chunks) into the partition of the year.
+			With workers > 0, the load runs as a pipeline (see util.pipeline.ChunkPipeline): one thread reads the
+			chunks, 'workers' threads apply the lookups and the transform and the current thread saves them,
+			so reading, transforming and COPY overlap.
+			With writers > 0, the chunks are saved by a pool of connections (see util.copy_writer_pool), each one
+			with its own COPY.
+			Every chunk is recorded in fact_load_state with its COPY (see FactLoadState) and the chunks already
+			loaded are skipped, so an interrupted load can be restarted. The summary tables are updated in the
+			same transaction (see FactSummary).
+			With swap=True the whole year is loaded again into a staging table (no foreign keys or indexes),
+			that replaces the partition of the year at the end (see swap_partition).
+			bulk=True is a swap load into an UNLOGGED staging table, committed with synchronous_commit off.
+			The indexes and the foreign keys are built and validated once, after the load (see
+			finish_bulk_staging). The time of each phase is logged and the read, lookup, transform and COPY of each
+			chunk are measured (see util.metrics).
+		:param df_iter: Dataframe iterator (default: the year file, from the first chunk not loaded yet, in chunks
+		of 50000 records)
+		:param workers: Number of lookup/transform threads (0 runs serially)
+		:param queue_depth: Max chunks waiting between the stages
+		:param writers: Number of COPY connections (0 saves each chunk with a new connection)
+		:param first_row: Position of the first chunk of df_iter in the file (0 or load_state.get_resume_row())
+		:param swap: Loads the year into a staging table and swaps the partition
+		:param bulk: Bulk load (implies swap)
+		:return: Number of records loaded
+		"""
+		swap = swap or bulk
+		if df_iter is None:
+			first_row = 0 if swap else self.load_state.get_resume_row()
+			df_iter = self.file_to_df(CHUNK_SIZE, skip_rows=first_row)
+
+		start_time = time.time()
+		indexes = []
+		if swap:
+			if bulk:
+				indexes = self.get_indexes(self.get_partition_name())
+			table_name = self.create_staging(unlogged=bulk)
+		else:
+			table_name = "flight_arrival_fact"
+			self.create_partition()
+		start_time = self.log_phase("prepare {}".format(table_name), start_time)
+
+		df_iter = get_metrics().measure_iter(
+			"FlightArrivalFact", self.load_state.iter_new_chunks(df_iter, first_row, skip_loaded=not swap))
+		chunks = []
+
+		def next_chunk():
+			chunk = self.load_state.next_chunk()
+			chunks.append(chunk)
+			# the chunks of a staging table are recorded only when it is swapped
+			return None if swap else chunk
+
+		if writers == 0:
+			self.run_chunks(
+				df_iter, lambda df: self.save(df, next_chunk(), table_name, bulk), workers=workers,
+				queue_depth=queue_depth)
+		else:
+			pool = CopyWriterPool(
+				self.db_client, connections=writers, name="FlightArrivalFact-writers", stage="FlightArrivalFact",
+				before_commit=lambda cursor, seq, df, chunk: self.before_commit(
+					cursor, df, chunk, bulk, summarize=not swap))
+			try:
+				self.run_chunks(
+					df_iter,
+					lambda df: pool.submit(df, context=next_chunk(), **self.get_copy_params(df, table_name)),
+					workers=workers, queue_depth=queue_depth)
+			except Exception:
+				pool.close(raise_errors=False)
+				raise
+
+			pool.close()
+		self.log_phase("load {} chunks ({} records)".format(len(chunks), sum(chunk[2] for chunk in chunks)), start_time)
+
+		if bulk:
+			self.finish_bulk_staging(table_name, indexes)
+		if swap:
+			self.swap_partition(table_name, chunks, indexes)
+
+		return sum(chunk[2] for chunk in chunks)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+import pandas as pd
+
+# Columns of the year file (Data Expo 2009), in the file order
+FILE_COLUMNS = [
+	"Year", "Month", "DayofMonth", "DayOfWeek", "DepTime", "CRSDepTime", "ArrTime", "CRSArrTime", "UniqueCarrier",
+	"FlightNum", "TailNum", "ActualElapsedTime", "CRSElapsedTime", "AirTime", "ArrDelay", "DepDelay", "Origin",
+	"Dest", "Distance", "TaxiIn", "TaxiOut", "Cancelled", "CancellationCode", "Diverted", "CarrierDelay",
+	"WeatherDelay", "NASDelay", "SecurityDelay", "LateAircraftDelay"
+]
+
+# Carrier, airport, tail and cancellation codes
+CODE_COLUMNS = ["UniqueCarrier", "TailNum", "Origin", "Dest", "CancellationCode"]
+
+# Final type of the integer columns
+INT_TYPES = {
+	"Year": "int16",
+	"Month": "int8",
+	"DayofMonth": "int8",
+	"DayOfWeek": "int8",
+	"DepTime": "int16",
+	"CRSDepTime": "int16",
+	"ArrTime": "int16",
+	"CRSArrTime": "int16",
+	"FlightNum": "int16",
+	"ActualElapsedTime": "int16",
+	"CRSElapsedTime": "int16",
+	"AirTime": "int16",
+	"ArrDelay": "int16",
+	"DepDelay": "int16",
+	"Distance": "int16",
+	"TaxiIn": "int16",
+	"TaxiOut": "int16",
+	"Cancelled": "int8",
+	"Diverted": "int8",
+	"CarrierDelay": "int16",
+	"WeatherDelay": "int16",
+	"NASDelay": "int16",
+	"SecurityDelay": "int16",
+	"LateAircraftDelay": "int16"
+}
+
+# Nullable columns, only used by the fact, where a null is loaded as 0.
+# They are read as float32 (to hold the NaN) and converted to INT_TYPES with the nulls filled.
+ZERO_FILL_COLUMNS = [
+	"DepTime", "CRSDepTime", "ArrTime", "CRSArrTime", "ActualElapsedTime", "CRSElapsedTime", "AirTime",
+	"ArrDelay", "DepDelay", "TaxiIn", "TaxiOut", "Diverted", "CarrierDelay", "WeatherDelay", "NASDelay",
+	"SecurityDelay", "LateAircraftDelay"
+]
+
+# pd.read_csv types: the other integer columns are never null and are read with the final type
+READ_DTYPES = dict(
+	{col: "category" for col in CODE_COLUMNS},
+	**{col: "float32" if col in ZERO_FILL_COLUMNS else dtype for col, dtype in INT_TYPES.items()}
+)
+
+
+def get_read_dtypes(usecols=None):
+	"""
+		pd.read_csv types of the columns to be read
+	:param usecols: Columns to be read (None reads all of them)
+	:return: dict
+	"""
+	return {col: dtype for col, dtype in READ_DTYPES.items() if usecols is None or col in usecols}
+
+
+def to_schema_types(df: pd.DataFrame):
+	"""
+		Converts the columns of a chunk (read with READ_DTYPES) to the final types: nulls filled with 0,
+		narrow integers and categories. Only the columns in the dataframe are converted.
+	:param df: Dataframe
+	:return: Dataframe
+	"""
+	for col in df.columns:
+		if col in ZERO_FILL_COLUMNS:
+			df[col] = df[col].fillna(0).astype(INT_TYPES[col])
+		elif col in INT_TYPES and df[col].dtype != INT_TYPES[col]:
+			df[col] = df[col].astype(INT_TYPES[col])
+		elif col in CODE_COLUMNS and df[col].dtype.name != "category":
+			df[col] = df[col].astype("category")
+
+	return df
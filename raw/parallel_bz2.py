@@ -0,0 +1,219 @@
+import bz2
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import io
+import mmap
+import os
+
+import pandas as pd
+
+BLOCK_MAGIC = 0x314159265359
+EOS_MAGIC = 0x177245385090
+MASK_48 = (1 << 48) - 1
+MASK_32 = (1 << 32) - 1
+
+
+def find_magic(mm, magic):
+	"""
+		Finds all the bit offsets of a 48 bits magic number. bzip2 blocks are not byte aligned, so the
+		magic is searched in its 8 possible shifts (only by the bytes it fully covers) and checked bit by bit.
+	:param mm: mmap (or bytes) of the file
+	:param magic: 48 bits number
+	:return: sorted list of bit offsets
+	"""
+	offsets = []
+	for shift in range(8):
+		window = (magic << (8 - shift)).to_bytes(7, "big")
+		pattern = window[0:6] if shift == 0 else window[1:6]
+		first_byte = 0 if shift == 0 else 1
+
+		pos = mm.find(pattern)
+		while pos >= 0:
+			start = pos - first_byte
+			if start >= 0 and start + 7 <= len(mm):
+				value = int.from_bytes(mm[start:start + 7], "big")
+				if (value >> (8 - shift)) & MASK_48 == magic:
+					offsets.append(start * 8 + shift)
+			pos = mm.find(pattern, pos + 1)
+
+	return sorted(offsets)
+
+
+def read_bits(mm, bit_offset, nbits):
+	first = bit_offset // 8
+	last = (bit_offset + nbits + 7) // 8
+	value = int.from_bytes(mm[first:last], "big")
+	return (value >> ((last - first) * 8 - (bit_offset % 8) - nbits)) & ((1 << nbits) - 1)
+
+
+def find_blocks(file_path):
+	"""
+		Lists the compressed blocks of a bz2 file (one or more streams).
+	:param file_path: bz2 file
+	:return: list of (start bit, end bit, block crc)
+	"""
+	with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+		starts = find_magic(mm, BLOCK_MAGIC)
+		ends = find_magic(mm, EOS_MAGIC)
+
+		markers = sorted([(offset, True) for offset in starts] + [(offset, False) for offset in ends])
+		blocks = []
+		for (offset, is_block), (next_offset, _) in zip(markers, markers[1:]):
+			if is_block:
+				blocks.append((offset, next_offset, read_bits(mm, offset + 48, 32)))
+
+	return blocks
+
+
+def blocks_to_stream(file_path, blocks):
+	"""
+		Builds a standalone bz2 stream with a range of blocks: header, the blocks (shifted to the stream
+		bit position), end of stream magic and the combined crc of the blocks.
+	:param file_path: bz2 file
+	:param blocks: Consecutive blocks (see find_blocks)
+	:return: bytes
+	"""
+	start_bit, end_bit = blocks[0][0], blocks[-1][1]
+	with open(file_path, "rb") as f:
+		f.seek(start_bit // 8)
+		data = f.read((end_bit + 7) // 8 - start_bit // 8)
+
+	nbits = end_bit - start_bit
+	value = int.from_bytes(data, "big") >> (len(data) * 8 - (start_bit % 8) - nbits) & ((1 << nbits) - 1)
+
+	combined_crc = 0
+	for _, _, crc in blocks:
+		combined_crc = (((combined_crc << 1) | (combined_crc >> 31)) & MASK_32) ^ crc
+
+	value = (((value << 48) | EOS_MAGIC) << 32) | combined_crc
+	nbits += 80
+	padding = (8 - nbits % 8) % 8
+
+	return b"BZh9" + (value << padding).to_bytes((nbits + padding) // 8, "big")
+
+
+def decompress_task(file_path, blocks, is_first, read_csv_params):
+	"""
+		Process pool task: decompresses a range of blocks and parses its complete lines.
+		The partial lines of the borders (first and last) are returned as bytes, to be joined with the
+		neighbour tasks.
+	:return: (head bytes, dataframe, tail bytes)
+	"""
+	data = bz2.decompress(blocks_to_stream(file_path, blocks))
+
+	first_line_end = data.find(b"\n") + 1
+	last_line_end = data.rfind(b"\n") + 1
+	if first_line_end == 0:
+		raise ValueError("No line break in {} blocks of {}".format(len(blocks), file_path))
+
+	head = data[:first_line_end]
+	body = data[first_line_end:last_line_end]
+	tail = data[last_line_end:]
+	if is_first:
+		# the first line of the file is the header
+		head = b""
+
+	return head, pd.read_csv(io.BytesIO(body), header=None, **read_csv_params), tail
+
+
+class ParallelBz2Reader:
+	"""
+		Reads a (csv) bz2 file decompressing and parsing ranges of blocks in a process pool.
+		bz2 blocks are independent, so each range becomes a standalone stream and the chunks are parsed
+		by all the cores. Lines broken between two ranges are joined and parsed by the reader.
+
+		The chunks are yielded in file order (ordered=True) or as soon as they are ready. Out of order,
+		the lines broken between ranges are yielded together as the last chunk.
+	"""
+
+	def __init__(self, file_path, usecols=None, processes=None, blocks_per_task=5, ordered=True, **read_csv_params):
+		"""
+		:param file_path: bz2 csv file
+		:param usecols: Columns to be read (None reads all of them)
+		:param processes: Size of the process pool (default: number of cores)
+		:param blocks_per_task: bz2 blocks of each chunk (a 900k block of the flight file has about 10k lines)
+		:param ordered: Yields the chunks in file order
+		:param read_csv_params: Other pd.read_csv parameters (sep, encoding, dtype...)
+		"""
+		self.file_path = file_path
+		self.processes = processes or os.cpu_count()
+		self.blocks_per_task = blocks_per_task
+		self.ordered = ordered
+
+		with bz2.open(file_path, "rt", encoding=read_csv_params.get("encoding", "utf-8")) as f:
+			names = pd.read_csv(io.StringIO(f.readline()), **read_csv_params).columns.tolist()
+
+		self.read_csv_params = dict(read_csv_params, names=names, usecols=usecols)
+
+	def get_tasks(self):
+		"""
+			Groups the blocks in ranges of 'blocks_per_task' blocks.
+		"""
+		blocks = find_blocks(self.file_path)
+		return [blocks[i:i + self.blocks_per_task] for i in range(0, len(blocks), self.blocks_per_task)]
+
+	def parse_lines(self, lines, dtypes):
+		"""
+			Parses the lines broken between tasks. One line is not enough to infer the column types, so
+			the columns without an explicit 'dtype' are read as text and the numeric columns of the
+			neighbour chunk are converted.
+		:param lines: list of bytes
+		:param dtypes: dtypes of a neighbour chunk
+		:return: dataframe
+		"""
+		explicit = self.read_csv_params.get("dtype") or {}
+		if not isinstance(explicit, dict):
+			return pd.read_csv(io.BytesIO(b"".join(lines)), header=None, **self.read_csv_params)
+
+		params = dict(self.read_csv_params, dtype=dict({col: object for col in dtypes.index}, **explicit))
+		df = pd.read_csv(io.BytesIO(b"".join(lines)), header=None, **params)
+		for col, dtype in dtypes.items():
+			if col not in explicit and dtype.kind in "biuf":
+				df[col] = pd.to_numeric(df[col])
+
+		return df
+
+	def __iter__(self):
+		tasks = self.get_tasks()
+		if len(tasks) == 0:
+			return
+
+		with ProcessPoolExecutor(max_workers=self.processes) as executor:
+			pending = deque()
+			results = {}
+			next_task = 0
+			while next_task < len(tasks) or pending:
+				while next_task < len(tasks) and len(pending) < 2 * self.processes:
+					future = executor.submit(
+						decompress_task, self.file_path, tasks[next_task], next_task == 0, self.read_csv_params)
+					pending.append((next_task, future))
+					next_task += 1
+
+				if self.ordered:
+					i, future = pending.popleft()
+					head, df, tail = future.result()
+					if i > 0:
+						df_border = self.parse_lines([results.pop(i - 1)[0], head], df.dtypes)
+						if len(df_border) > 0:
+							df = pd.concat([df_border, df], ignore_index=True)
+					results[i] = (tail, df.dtypes)
+					yield df
+				else:
+					wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+					for item in [item for item in pending if item[1].done()]:
+						pending.remove(item)
+						i, future = item
+						head, df, tail = future.result()
+						results[i] = (head, tail, df.dtypes)
+						yield df
+
+		last = len(tasks) - 1
+		if self.ordered:
+			last_tail, dtypes = results.pop(last)
+			if last_tail.strip():
+				yield self.parse_lines([last_tail], dtypes)
+		else:
+			lines = [results[i][1] + results[i + 1][0] for i in range(last)] + [results[last][1]]
+			lines = [line if line.endswith(b"\n") else line + b"\n" for line in lines if line.strip()]
+			if lines:
+				yield self.parse_lines(lines, results[last][2])
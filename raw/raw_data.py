@@ -1,14 +1,340 @@
-from util.utils import download_file
+from util.utils import get_download_manager
 from definitions import ROOT_DIR
+from raw.flight_schema import FILE_COLUMNS, CODE_COLUMNS, INT_TYPES, get_read_dtypes, to_schema_types
+from raw.parallel_bz2 import ParallelBz2Reader
+import pandas as pd
+import bz2
+import glob
+import hashlib
+import logging
 import os
 
+try:
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+except ImportError:
+	pa = None
+	pq = None
+
+CHUNK_SIZE = 50000
+# Approximate number of lines of the flight file in one 900k bz2 block
+LINES_PER_BLOCK = 10000
+# Size of the process pool of the parallel reader (0 reads in the current process)
+READ_PROCESSES = int(os.getenv("FL_ARR_READ_PROCESSES", "0"))
+# Reads (and writes) the parquet cache of the year files (see cache_flight_arrival_data)
+USE_CACHE = os.getenv("FL_ARR_CACHE", "1") == "1"
+# Directory of the year files (e.g. synthetic files of the benchmark)
+RAW_DIR = os.getenv("FL_ARR_RAW_DIR", os.path.join(ROOT_DIR, "raw"))
+CACHE_DIR = os.path.join(RAW_DIR, "cache")
+
+# Url of the year files ({year} is replaced by the year), e.g. a local mirror
+SOURCE_URL = os.getenv("FL_ARR_SOURCE_URL", "http://stat-computing.org/dataexpo/2009/{year}.csv.bz2")
+# Expected checksums of the year files, in the sha256sum format (optional)
+SOURCE_CHECKSUMS = os.path.join(ROOT_DIR, "raw", "checksums.sha256")
+
+checksums = {}
+
+
+def get_source_url(year):
+	return SOURCE_URL.format(year=year)
+
+
+def get_source_checksum(year):
+	"""
+		Expected sha256 of the year file, from raw/checksums.sha256 (lines "[sha256]  [year].csv.bz2")
+	:return: Hex digest or None
+	"""
+	if not os.path.exists(SOURCE_CHECKSUMS):
+		return None
+
+	with open(SOURCE_CHECKSUMS) as f:
+		for line in f:
+			parts = line.split()
+			if len(parts) == 2 and parts[1].lstrip("*") == "{}.csv.bz2".format(year):
+				return parts[0]
+
+	return None
+
 
 def get_flight_arrival_data(year):
-	download_file(
-		url="http://stat-computing.org/dataexpo/2009/{}.csv.bz2".format(year),
-		file_name=os.path.join(ROOT_DIR, "raw", "{}.csv.bz2".format(str(year)))
+	"""
+		Downloads the year file (see util.download_manager): an unchanged file is not downloaded again and an
+		interrupted download is resumed.
+	:param year: Year of the data
+	:return: sha256 of the file
+	"""
+	return get_download_manager().download(get_source_url(year), get_file_path(year), get_source_checksum(year))
+
+
+def get_flight_arrival_files(years, threads=4):
+	"""
+		Downloads the files of several years at the same time
+	:param years: Years of the data
+	:param threads: Max downloads at the same time
+	:return: list with the sha256 of each file
+	"""
+	return get_download_manager().download_all(
+		[(get_source_url(year), get_file_path(year), get_source_checksum(year)) for year in years], threads=threads)
+
+
+def open_flight_arrival_stream(year):
+	"""
+		Compressed year file, read while it is downloaded (see DownloadManager.open_stream). At the end of the
+		file the download is stored, so the next runs read the local file.
+	:param year: Year of the data
+	:return: Binary file object
+	"""
+	return get_download_manager().open_stream(get_source_url(year), get_file_path(year), get_source_checksum(year))
+
+
+def get_file_path(year):
+	return os.path.join(RAW_DIR, "{}.csv.bz2".format(year))
+
+
+def file_checksum(file_path):
+	"""
+		sha256 of a file. It is computed once per file version (size and modification time).
+	:param file_path: File
+	:return: Hex digest
+	"""
+	stat = os.stat(file_path)
+	key = (file_path, stat.st_size, stat.st_mtime)
+	if key not in checksums:
+		sha = hashlib.sha256()
+		with open(file_path, "rb") as f:
+			for block in iter(lambda: f.read(1024 * 1024), b""):
+				sha.update(block)
+		checksums[key] = sha.hexdigest()
+
+	return checksums[key]
+
+
+def get_cache_path(year):
+	"""
+		Cache of the current year file: raw/cache/[year]-[checksum].parquet
+	:param year: Year of the data
+	:return: Path (the file may not exist yet)
+	"""
+	return os.path.join(CACHE_DIR, "{}-{}.parquet".format(year, file_checksum(get_file_path(year))[0:16]))
+
+
+def get_cache_schema():
+	types = {"int8": pa.int8(), "int16": pa.int16()}
+	return pa.schema([
+		pa.field(col, pa.string()) if col in CODE_COLUMNS else pa.field(col, types[INT_TYPES[col]])
+		for col in FILE_COLUMNS
+	])
+
+
+def to_cache_types(df: pd.DataFrame):
+	"""
+		Converts a chunk (with the schema types) to the types of the cache: the codes are stored as text.
+	:param df: Dataframe with all the columns
+	:return: Dataframe
+	"""
+	for col in CODE_COLUMNS:
+		df[col] = df[col].astype(object).where(df[col].notnull(), None)
+
+	return df[FILE_COLUMNS]
+
+
+def from_cache_types(df: pd.DataFrame):
+	for col in CODE_COLUMNS:
+		if col in df.columns:
+			df[col] = df[col].astype("category")
+
+	return df
+
+
+def cache_flight_arrival_data(year):
+	"""
+		Converts the year file (already downloaded) to a typed parquet file, with one row group per chunk.
+		The cache is named by the checksum of the file, so a new download is converted again.
+		Nothing is done if pyarrow is not installed or the cache is disabled (FL_ARR_CACHE=0).
+	:param year: Year of the data
+	:return: Cache path (or None)
+	"""
+	if not USE_CACHE:
+		return None
+	if pq is None:
+		logging.warning("pyarrow is not installed, the year file will be read from the csv")
+		return None
+
+	cache_path = get_cache_path(year)
+	if os.path.exists(cache_path):
+		return cache_path
+
+	os.makedirs(CACHE_DIR, exist_ok=True)
+	for old_path in glob.glob(os.path.join(CACHE_DIR, "{}-*.parquet".format(year))):
+		os.remove(old_path)
+
+	schema = get_cache_schema()
+	tmp_path = cache_path + ".tmp"
+	writer = pq.ParquetWriter(tmp_path, schema)
+	try:
+		df_iter = read_csv_data(year, chunksize=CHUNK_SIZE)
+		for df in df_iter:
+			writer.write_table(pa.Table.from_pandas(to_cache_types(df), schema=schema, preserve_index=False))
+	finally:
+		writer.close()
+
+	os.replace(tmp_path, cache_path)
+
+	return cache_path
+
+
+def skip_first_rows(df_iter, skip_rows):
+	"""
+		Drops the first 'skip_rows' rows of a dataframe iterator
+	"""
+	for df in df_iter:  # type: pd.DataFrame
+		if skip_rows >= len(df):
+			skip_rows -= len(df)
+			continue
+		if skip_rows > 0:
+			df = df.iloc[skip_rows:].reset_index(drop=True)
+			skip_rows = 0
+		yield df
+
+
+def rechunk(df_iter, chunksize):
+	"""
+		Splits / joins the dataframes of an iterator into chunks of exactly 'chunksize' rows (the last one may be
+		smaller), e.g. the block sized chunks of ParallelBz2Reader
+	"""
+	buffer, rows = [], 0
+	for df in df_iter:  # type: pd.DataFrame
+		buffer.append(df)
+		rows += len(df)
+		if rows < chunksize:
+			continue
+
+		df = pd.concat(buffer, ignore_index=True)
+		for start in range(0, len(df) - chunksize + 1, chunksize):
+			yield df.iloc[start:start + chunksize].reset_index(drop=True)
+		rest = df.iloc[len(df) - len(df) % chunksize:].reset_index(drop=True)
+		buffer, rows = [rest], len(rest)
+
+	if rows > 0:
+		yield pd.concat(buffer, ignore_index=True)
+
+
+def read_cache(cache_path, usecols=None, chunksize=None, skip_rows=0):
+	"""
+		Reads the parquet cache, only with the given columns.
+	:param cache_path: Cache file
+	:param usecols: Columns to be read (None reads all of them)
+	:param chunksize: If informed, the cache is read by row group and cut into chunks of 'chunksize' records (the
+	chunks of the csv readers, see FactLoadState)
+	:param skip_rows: Number of rows skipped (the row groups before them are not read)
+	:return: dataframe (or dataframe iterator, if chunksize is informed)
+	"""
+	columns = None if usecols is None else [col for col in FILE_COLUMNS if col in usecols]
+	if chunksize is None:
+		df = pq.read_table(cache_path, columns=columns).to_pandas()
+		return from_cache_types(df.iloc[skip_rows:].reset_index(drop=True) if skip_rows > 0 else df)
+
+	parquet_file = pq.ParquetFile(cache_path)
+	first_group = 0
+	while first_group < parquet_file.num_row_groups:
+		group_rows = parquet_file.metadata.row_group(first_group).num_rows
+		if skip_rows < group_rows:
+			break
+		skip_rows -= group_rows
+		first_group += 1
+
+	# the codes are converted to categories after the row groups are cut / joined (categories of each chunk)
+	df_iter = skip_first_rows((
+		parquet_file.read_row_group(i, columns=columns).to_pandas()
+		for i in range(first_group, parquet_file.num_row_groups)
+	), skip_rows)
+
+	return (from_cache_types(df) for df in rechunk(df_iter, chunksize))
+
+
+def read_csv_data(year, usecols=None, chunksize=None, processes=None, ordered=True, skip_rows=0):
+	"""
+		Read the csv file of the year, with the types of raw.flight_schema. With processes > 0 the file is
+		decompressed and parsed by a process pool (see ParallelBz2Reader). In file order its chunks (whole bz2
+		blocks) are cut again to 'chunksize' records, so the positions of the chunks (see FactLoadState) and
+		the row groups of the cache are the same of the serial reader. Out of order (ordered=False), the chunks
+		have about 'chunksize' records and no position in the file: they must not be used by a load that is
+		checkpointed (the fact).
+		A resumed load (skip_rows > 0) does not seek: the rows skipped are still decompressed and tokenized (the
+		callable skiprows only drops them before the conversion, the parallel reader after it), so a resume costs
+		the read of the rows already loaded. Only the cache (read_cache) skips whole row groups.
+	"""
+	file_path = get_file_path(year)
+	processes = READ_PROCESSES if processes is None else processes
+	dtype = get_read_dtypes(usecols)
+
+	if processes > 0:
+		df_iter = skip_first_rows(ParallelBz2Reader(
+			file_path, usecols=usecols, processes=processes,
+			blocks_per_task=max(1, round((chunksize or CHUNK_SIZE) / LINES_PER_BLOCK)),
+			ordered=ordered, sep=",", encoding="utf-8", dtype=dtype
+		), skip_rows)
+		if ordered:
+			df_iter = rechunk(df_iter, chunksize or CHUNK_SIZE)
+	else:
+		df_iter = pd.read_csv(
+			filepath_or_buffer=file_path,
+			sep=",", compression="bz2", encoding="utf-8", usecols=usecols, chunksize=chunksize or CHUNK_SIZE,
+			dtype=dtype, skiprows=(lambda i: 0 < i <= skip_rows) if skip_rows > 0 else None
+		)
+
+	df_iter = (to_schema_types(df) for df in df_iter)
+	if chunksize is None:
+		return to_schema_types(pd.concat(list(df_iter), ignore_index=True))
+
+	return df_iter
+
+
+def read_stream_data(year, usecols=None, chunksize=None, skip_rows=0):
+	"""
+		Reads the csv of the year while it is downloaded: the response is decompressed (bz2.BZ2File) and parsed
+		as it arrives, so the first chunks are ready before the end of the download. The rows skipped by a resume
+		are downloaded and parsed again (see read_csv_data).
+	"""
+	df_iter = pd.read_csv(
+		filepath_or_buffer=bz2.BZ2File(open_flight_arrival_stream(year)),
+		sep=",", encoding="utf-8", usecols=usecols, chunksize=chunksize or CHUNK_SIZE, dtype=get_read_dtypes(usecols),
+		skiprows=(lambda i: 0 < i <= skip_rows) if skip_rows > 0 else None
 	)
 
+	df_iter = (to_schema_types(df) for df in df_iter)
+	if chunksize is None:
+		return to_schema_types(pd.concat(list(df_iter), ignore_index=True))
+
+	return df_iter
+
+
+def read_flight_arrival_data(
+		year, usecols=None, chunksize=None, processes=None, ordered=True, skip_rows=0, stream=False):
+	"""
+		Read the data file of the year (already downloaded) into a pandas dataframe.
+		The parquet cache is used when it exists for the current file (see cache_flight_arrival_data),
+		otherwise the csv file is read (see read_csv_data).
+	:param year: Year of the data
+	:param usecols: Columns to be read (None reads all of them)
+	:param chunksize: It is used to avoid loading all the file in memory
+	:param processes: Size of the process pool of the csv reader (default: FL_ARR_READ_PROCESSES)
+	:param ordered: Only for processes > 0, yields the chunks in file order (see read_csv_data)
+	:param skip_rows: Number of records skipped at the beginning of the file (e.g. to resume a load)
+	:param stream: If the year file is not downloaded yet, it is read while it is downloaded (see read_stream_data)
+	:return: dataframe (or dataframe iterator, if chunksize is informed)
+	"""
+	if stream and not os.path.exists(get_file_path(year)):
+		return read_stream_data(year, usecols=usecols, chunksize=chunksize, skip_rows=skip_rows)
+
+	if USE_CACHE and pq is not None:
+		cache_path = get_cache_path(year)
+		if os.path.exists(cache_path):
+			return read_cache(cache_path, usecols=usecols, chunksize=chunksize, skip_rows=skip_rows)
+
+	return read_csv_data(
+		year, usecols=usecols, chunksize=chunksize, processes=processes, ordered=ordered, skip_rows=skip_rows)
+
 
 if __name__ == '__main__':
 	get_flight_arrival_data(2008)
@@ -0,0 +1,89 @@
+import pandas as pd
+
+from raw.raw_data import read_flight_arrival_data, CHUNK_SIZE
+from util.utils import get_metrics
+
+
+class RawDataScanner():
+	"""
+		Reads the year file (raw/[year].csv.bz2) only once and hands every chunk to a list of consumers,
+		so the file is decompressed a single time for all the dimensions and the fact.
+
+		A consumer must have:
+		- source_columns: the columns it needs from the file (None means all of them);
+		- process_chunk(df): called once per chunk with a dataframe holding only the source_columns.
+
+		Consumers are called in the given order, so the fact must come after the dimensions it looks up.
+		The read of the file is measured as the stage RawDataScanner and each consumer as its own stage
+		(see util.metrics).
+	"""
+
+	def __init__(self, year, consumers, chunksize=CHUNK_SIZE, skip_rows=0, stream=False):
+		"""
+		:param year: Year of the data
+		:param consumers: List of dimensions / facts
+		:param chunksize: Number of records of each chunk
+		:param skip_rows: Number of records skipped at the beginning of the file (e.g. already loaded)
+		:param stream: Reads the file while it is downloaded, if it is not downloaded yet
+		"""
+		self.year = year
+		self.consumers = consumers
+		self.chunksize = chunksize
+		self.skip_rows = skip_rows
+		self.stream = stream
+
+	def get_usecols(self, source_columns=()):
+		"""
+			Union of the columns needed by all the consumers.
+		:param source_columns: Columns needed by the caller of iter_chunks (None means all of them)
+		:return: list of columns or None, if any consumer needs the full file
+		"""
+		if source_columns is None:
+			return None
+
+		usecols = list(source_columns)
+		for consumer in self.consumers:
+			if consumer.source_columns is None:
+				return None
+			usecols += [col for col in consumer.source_columns if col not in usecols]
+
+		return usecols
+
+	def iter_chunks(self, source_columns=None):
+		"""
+			Reads the file in chunks and, to each chunk, calls all the consumers with their own columns.
+			After that, the chunk is yielded to the caller, e.g. to feed the fact pipeline
+			(FlightArrivalFact.run(df_iter=...)) with chunks whose dimension records are already saved.
+		:param source_columns: Columns yielded (None means all of them)
+		:return: Dataframe iterator
+		"""
+		df_iter = read_flight_arrival_data(
+			self.year, usecols=self.get_usecols(source_columns), chunksize=self.chunksize, skip_rows=self.skip_rows,
+			stream=self.stream)
+		for df in get_metrics().measure_iter("RawDataScanner", df_iter):  # type: pd.DataFrame
+			for consumer in self.consumers:
+				with get_metrics().measure(type(consumer).__name__, "transform", rows=len(df)):
+					if consumer.source_columns is None:
+						consumer.process_chunk(df.copy())
+					else:
+						consumer.process_chunk(df[consumer.source_columns].copy())
+
+			yield df if source_columns is None else df[source_columns]
+
+	def run(self):
+		"""
+			Reads the file in chunks and, to each chunk, calls all the consumers with their own columns.
+		"""
+		last = len(self.consumers) - 1
+		df_iter = read_flight_arrival_data(
+			self.year, usecols=self.get_usecols(), chunksize=self.chunksize, skip_rows=self.skip_rows,
+			stream=self.stream)
+		for df in get_metrics().measure_iter("RawDataScanner", df_iter):  # type: pd.DataFrame
+			for i, consumer in enumerate(self.consumers):
+				with get_metrics().measure(type(consumer).__name__, "transform", rows=len(df)):
+					if consumer.source_columns is not None:
+						consumer.process_chunk(df[consumer.source_columns].copy())
+					elif i == last:
+						consumer.process_chunk(df)
+					else:
+						consumer.process_chunk(df.copy())
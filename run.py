@@ -6,35 +6,96 @@ from dimension.date_dimension import DateDimension
 from dimension.flight_dimension import FlightDimension
 from dimension.travel_dimension import TravelDimension
 from fact.flight_arrival_fact import FlightArrivalFact
-from raw.raw_data import get_flight_arrival_data
+from raw.raw_data import get_flight_arrival_data, cache_flight_arrival_data
+from raw.raw_scanner import RawDataScanner
+from util.stage_dag import Stage, StageDag
+from util.utils import get_metrics
 import logging
 
 year = os.environ["FL_ARR_YEAR"]
+fact_workers = int(os.getenv("FL_ARR_WORKERS", "0"))
+fact_writers = int(os.getenv("FL_ARR_WRITERS", "0"))
+fact_reload = os.getenv("FL_ARR_RELOAD", "0") == "1"
+fact_swap = os.getenv("FL_ARR_SWAP", "0") == "1"
+fact_bulk = os.getenv("FL_ARR_BULK", "0") == "1"
+# Loads the dimensions and the fact while the year file is downloaded
+stream = os.getenv("FL_ARR_STREAM", "0") == "1"
+# Comma separated stages to run (default: all of them), e.g. FL_ARR_STAGES=fact
+stages = os.getenv("FL_ARR_STAGES")
+stage_threads = int(os.getenv("FL_ARR_STAGE_THREADS", "4"))
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logging.info("**** Loading data for {}".format(year))
 
-logging.info("Getting data source...".format(year))
-get_flight_arrival_data(year)
-logging.info("Getting data source... ok!".format(year))
 
-logging.info("Loading cancel dimension...".format(year))
-CancelDimension(year).run()
+def download():
+	get_flight_arrival_data(year)
 
-logging.info("Loading carrier dimension... ".format(year))
-CarrierDimension().run()
 
-logging.info("Loading date dimension... ".format(year))
-DateDimension(year).run()
+def cache():
+	cache_flight_arrival_data(year)
 
-logging.info("Loading flight dimension...".format(year))
-FlightDimension(year).run()
 
-logging.info("Loading travel dimension...".format(year))
-TravelDimension(year).run()
+def carrier():
+	CarrierDimension().run()
 
-logging.info("Loading fact...".format(year))
-FlightArrivalFact(year).run()
+
+def cancel():
+	CancelDimension(year, static=True).run()
+
+
+def date():
+	DateDimension(year, from_calendar=True).run()
+
+
+def fact():
+	# One read of the year file for the flight and travel dimensions and the fact: each chunk loads the dimensions
+	# first and then the fact. With FL_ARR_STREAM=1 the file is read while it is downloaded.
+	# An interrupted load restarts after the last chunk loaded (FL_ARR_RELOAD=1 deletes the year and loads it again).
+	# FL_ARR_SWAP=1 loads the whole year into a staging table and then replaces the partition of the year with it.
+	# FL_ARR_BULK=1 is a swap with an unlogged staging table, with indexes and foreign keys built after the load.
+	flight_arrival_fact = FlightArrivalFact(year)
+	if fact_reload:
+		flight_arrival_fact.delete()
+
+	scanner = RawDataScanner(
+		year=year,
+		consumers=[FlightDimension(year), TravelDimension(year)],
+		skip_rows=0 if fact_swap or fact_bulk else flight_arrival_fact.load_state.get_resume_row(),
+		stream=stream
+	)
+	flight_arrival_fact.run(
+		df_iter=scanner.iter_chunks(), workers=fact_workers, writers=fact_writers, first_row=scanner.skip_rows,
+		swap=fact_swap, bulk=fact_bulk)
+
+
+# The dimensions do not depend on each other and run at the same time; the fact waits for all of them.
+if stream:
+	load_stages = [
+		Stage("carrier", carrier),
+		Stage("cancel", cancel),
+		Stage("date", date),
+		Stage("fact", fact, depends=["carrier", "cancel", "date"])
+	]
+else:
+	load_stages = [
+		Stage("download", download),
+		Stage("cache", cache, depends=["download"]),
+		Stage("carrier", carrier),
+		Stage("cancel", cancel),
+		Stage("date", date),
+		Stage("fact", fact, depends=["cache", "carrier", "cancel", "date"])
+	]
+
+try:
+	StageDag(
+		stages=load_stages,
+		threads=stage_threads,
+		name="FlightArrival"
+	).run(selected=None if stages is None else [stage.strip() for stage in stages.split(",")])
+finally:
+	# the measures of a failed load are logged too
+	get_metrics().log_summary("Metrics - {}".format(year))
 
 logging.info("Data loaded!".format(year))
\ No newline at end of file
@@ -0,0 +1,118 @@
+import threading
+import time
+import unittest
+
+import pandas as pd
+
+from util.copy_writer_pool import CopyWriterPool
+
+
+class FakeConnection:
+
+	def __init__(self, client):
+		self.client = client
+		self.closed = False
+
+	def cursor(self):
+		return self
+
+	def commit(self):
+		pass
+
+	def rollback(self):
+		pass
+
+	def invalidate(self):
+		self.closed = True
+
+	def close(self):
+		self.closed = True
+
+
+class FakeClient:
+	"""
+		PostgresClient stand-in: the COPY of the chunks in 'fail' raises (every attempt or only the first ones)
+	"""
+
+	def __init__(self, fail=(), attempts_failing=None):
+		self.fail = set(fail)
+		self.attempts_failing = attempts_failing
+		self.attempts = {}
+		self.copied = []
+		self.__lock = threading.Lock()
+
+	def get_max_connections(self):
+		return 15
+
+	def get_conn_engine(self):
+		return self
+
+	def raw_connection(self):
+		return FakeConnection(self)
+
+	def copy_df_to_table(self, df, cursor, **copy_params):
+		chunk = int(df["chunk"].iloc[0])
+		with self.__lock:
+			self.attempts[chunk] = self.attempts.get(chunk, 0) + 1
+			if chunk in self.fail and (self.attempts_failing is None or self.attempts[chunk] <= self.attempts_failing):
+				raise IOError("COPY of chunk {} failed".format(chunk))
+			self.copied.append(chunk)
+
+		return 10
+
+
+def chunk(i):
+	return pd.DataFrame({"chunk": [i]})
+
+
+class CopyWriterPoolTest(unittest.TestCase):
+
+	def test_all_committed(self):
+		client = FakeClient()
+		pool = CopyWriterPool(client, connections=3)
+		for i in range(10):
+			self.assertEqual(pool.submit(chunk(i), table_name="t"), i)
+		pool.close()
+
+		self.assertEqual(sorted(client.copied), list(range(10)))
+		self.assertEqual(pool.watermark(), 9)
+		self.assertEqual(pool.chunks_committed, 10)
+		self.assertEqual(pool.bytes_copied, 100)
+
+	def test_retry(self):
+		client = FakeClient(fail=[4], attempts_failing=1)
+		pool = CopyWriterPool(client, connections=2, retries=1)
+		for i in range(8):
+			pool.submit(chunk(i), table_name="t")
+		pool.close()
+
+		self.assertEqual(client.attempts[4], 2)
+		self.assertEqual(pool.watermark(), 7)
+		self.assertEqual(pool.failed, {})
+
+	def test_failed_chunk(self):
+		client = FakeClient(fail=[5])
+		pool = CopyWriterPool(client, connections=2, retries=1)
+		for i in range(6):
+			pool.submit(chunk(i), table_name="t")
+
+		deadline = time.time() + 10
+		while not pool.failed and time.time() < deadline:
+			time.sleep(0.01)
+		self.assertEqual(list(pool.failed.keys()), [5])
+		self.assertEqual(client.attempts[5], 2)
+		with self.assertRaises(ValueError):
+			pool.submit(chunk(6), table_name="t")
+
+		with self.assertRaises(ValueError):
+			pool.close()
+		self.assertEqual(pool.watermark(), 4)
+		self.assertNotIn(5, client.copied)
+
+	def test_too_many_connections(self):
+		with self.assertRaises(ValueError):
+			CopyWriterPool(FakeClient(), connections=15)
+
+
+if __name__ == "__main__":
+	unittest.main()
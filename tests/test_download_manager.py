@@ -0,0 +1,141 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from util.download_manager import DownloadManager
+
+DATA = os.urandom(300000)
+
+
+class Handler(BaseHTTPRequestHandler):
+	"""
+		Stand-in of the Data Expo server: ETag, If-None-Match, Range / If-Range and a response truncated on demand
+	"""
+	# bytes sent by the next full (200) response before the connection is closed (0 sends all of them)
+	cut = 0
+	requests = []
+
+	def do_GET(self):
+		etag = '"{}"'.format(hashlib.md5(DATA).hexdigest())
+		request = {key: self.headers.get(key) for key in ["If-None-Match", "Range", "If-Range"]}
+		Handler.requests.append(request)
+
+		if request["If-None-Match"] == etag:
+			request["status"] = 304
+			self.send_response(304)
+			self.end_headers()
+			return
+
+		start = 0
+		if request["Range"] and request["If-Range"] == etag:
+			start = int(request["Range"].split("=")[1].split("-")[0])
+			if start >= len(DATA):
+				request["status"] = 416
+				self.send_error(416)
+				return
+			request["status"] = 206
+			self.send_response(206)
+			self.send_header("Content-Range", "bytes {}-{}/{}".format(start, len(DATA) - 1, len(DATA)))
+		else:
+			request["status"] = 200
+			self.send_response(200)
+
+		body = DATA[start:]
+		self.send_header("ETag", etag)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		if Handler.cut and start == 0:
+			self.wfile.write(body[:Handler.cut])
+			Handler.cut = 0
+			self.close_connection = True
+			return
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+class DownloadManagerTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.server = Server(("127.0.0.1", 0), Handler)
+		threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+		cls.url = "http://127.0.0.1:{}/2008.csv.bz2".format(cls.server.server_address[1])
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.server.shutdown()
+		cls.server.server_close()
+
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.file_path = os.path.join(self.tmp_dir, "raw", "2008.csv.bz2")
+		self.manager = DownloadManager(os.path.join(self.tmp_dir, "cache"), retries=1, timeout=10)
+		Handler.cut = 0
+		Handler.requests = []
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp_dir)
+
+	def read_file(self):
+		with open(self.file_path, "rb") as f:
+			return f.read()
+
+	def test_resume_truncated_response(self):
+		Handler.cut = 100000
+
+		sha256 = self.manager.download(self.url, self.file_path)
+
+		self.assertEqual(self.read_file(), DATA)
+		self.assertEqual(sha256, hashlib.sha256(DATA).hexdigest())
+		self.assertEqual([request["status"] for request in Handler.requests], [200, 206])
+		self.assertEqual(Handler.requests[1]["Range"], "bytes=100000-")
+		self.assertIsNotNone(Handler.requests[1]["If-Range"])
+
+	def test_not_modified(self):
+		self.manager.download(self.url, self.file_path)
+		os.remove(self.file_path)
+
+		self.manager.download(self.url, self.file_path)
+
+		self.assertEqual(self.read_file(), DATA)
+		self.assertEqual([request["status"] for request in Handler.requests], [200, 304])
+		self.assertIsNotNone(Handler.requests[1]["If-None-Match"])
+
+	def test_range_not_satisfiable(self):
+		"""
+			A part file longer than the file (e.g. of an old version with the same ETag) is downloaded again
+		"""
+		part_path = self.manager.get_part_path(self.url)
+		with open(part_path, "wb") as f:
+			f.write(DATA + b"old data")
+		with open(part_path + ".json", "w") as f:
+			json.dump({"etag": '"{}"'.format(hashlib.md5(DATA).hexdigest()), "last_modified": None}, f)
+
+		self.manager.download(self.url, self.file_path)
+
+		self.assertEqual(self.read_file(), DATA)
+		self.assertEqual([request["status"] for request in Handler.requests], [416, 200])
+
+	def test_bad_checksum(self):
+		with self.assertRaises(ValueError):
+			self.manager.download(self.url, self.file_path, sha256="0" * 64)
+
+		self.assertFalse(os.path.exists(self.file_path))
+		self.assertFalse(os.path.exists(self.manager.get_part_path(self.url)))
+		self.assertIsNone(self.manager.get_cached_entry(self.url))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+import pandas as pd
+
+from fact.fact_load_state import FactLoadState
+
+
+class FakeLoadState(FactLoadState):
+	"""
+		State with chunks of 10 rows committed at the offsets 0, 10, 20 and 40 (the chunk 30 was not committed)
+	"""
+
+	def query_from_db(self):
+		return pd.DataFrame({
+			"chunk_index": [0, 1, 2, 4],
+			"row_offset": [0, 10, 20, 40],
+			"row_count": [10, 10, 10, 10]
+		}, columns=["chunk_index", "row_offset", "row_count"])
+
+
+def chunks(first_row=0, last_row=60, size=10):
+	"""
+		Chunks of the file from the row 'first_row', with the position of each row
+	"""
+	for start in range(first_row, last_row, size):
+		yield pd.DataFrame({"row": range(start, min(start + size, last_row))})
+
+
+class FactLoadStateTest(unittest.TestCase):
+
+	def setUp(self):
+		self.state = FakeLoadState(2008)
+
+	def read(self, df_iter, **params):
+		"""
+		:return: first row of each chunk yielded and the positions queued to be recorded
+		"""
+		rows = [int(df["row"].iloc[0]) for df in self.state.iter_new_chunks(df_iter, **params)]
+		pending = [self.state.next_chunk() for _ in rows]
+
+		return rows, pending
+
+	def test_resume_point(self):
+		self.assertEqual(self.state.get_resume_point(), (30, 3))
+		self.assertEqual(self.state.get_resume_row(), 30)
+
+	def test_skip_loaded(self):
+		rows, pending = self.read(chunks())
+
+		self.assertEqual(rows, [30, 50])
+		self.assertEqual(pending, [(3, 30, 10), (5, 50, 10)])
+
+	def test_resume(self):
+		rows, pending = self.read(chunks(first_row=30), first_row=30)
+
+		self.assertEqual(rows, [30, 50])
+		self.assertEqual(pending, [(3, 30, 10), (5, 50, 10)])
+
+	def test_reload(self):
+		rows, pending = self.read(chunks(), skip_loaded=False)
+
+		self.assertEqual(rows, [0, 10, 20, 30, 40, 50])
+		self.assertEqual([chunk[0] for chunk in pending], list(range(6)))
+
+	def test_first_row(self):
+		with self.assertRaises(ValueError):
+			self.read(chunks(first_row=20), first_row=20)
+
+	def test_overlap(self):
+		"""
+			A restart with another chunk size reads chunks that are partially loaded
+		"""
+		# rows 30-44: the end of the chunk is in the chunk 40
+		with self.assertRaises(ValueError):
+			self.read(chunks(first_row=30, size=15), first_row=30)
+
+		# rows 0-4: same offset of a loaded chunk, with another size
+		with self.assertRaises(ValueError):
+			self.read(chunks(size=5))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from fact.flight_arrival_fact import FlightArrivalFact
+
+
+def to_seconds(values, dtype="int16"):
+	return FlightArrivalFact.hhmm_to_seconds(pd.Series(values, dtype=dtype, name="DepTime"))
+
+
+class HhmmToSecondsTest(unittest.TestCase):
+
+	def test_valid(self):
+		seconds = to_seconds([0, 1, 59, 100, 1435, 2359])
+
+		self.assertEqual(seconds.tolist(), [0, 60, 3540, 3600, 52500, 86340])
+		self.assertEqual(seconds.dtype, np.int32)
+
+	def test_end_of_day(self):
+		"""
+			2400 is 24:00 (a valid postgres time), not 00:00 of the next day
+		"""
+		self.assertEqual(to_seconds([2400]).tolist(), [86400])
+
+	def test_invalid(self):
+		with self.assertLogs(level="WARNING") as logs:
+			seconds = to_seconds([-5, 2401, 3000, 160, 1299, 1230])
+
+		self.assertEqual(seconds.tolist(), [0, 0, 0, 0, 0, 45000])
+		self.assertEqual(len(logs.output), 1)
+		self.assertIn("5 invalid times in DepTime", logs.output[0])
+
+	def test_missing(self):
+		"""
+			Missing times are 0 after the reader (see raw.flight_schema) or NaN in a float column
+		"""
+		self.assertEqual(to_seconds([0, 830]).tolist(), [0, 30600])
+
+		seconds = to_seconds([np.nan, 830.0, np.nan], dtype="float64")
+		self.assertEqual(seconds.tolist(), [0, 30600, 0])
+		self.assertEqual(seconds.dtype, np.int32)
+
+
+if __name__ == "__main__":
+	unittest.main()
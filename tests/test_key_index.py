@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from util.key_index import KeyIndex, encode_keys
+
+
+def get_index():
+	"""
+		Flight dimension as read from the database: int flight numbers and text tail numbers (null allowed)
+	"""
+	index = KeyIndex("sk_flight", ["flight_number", "tail_number"])
+	index.add(pd.DataFrame({
+		"sk_flight": [10, 11, 12],
+		"flight_number": [1, 2, 2],
+		"tail_number": [None, "N100", "N200"]
+	}, columns=["sk_flight", "flight_number", "tail_number"]))
+
+	return index
+
+
+class KeyIndexTest(unittest.TestCase):
+
+	def test_encode_keys(self):
+		df = pd.DataFrame({"a": [1, 2, 1, 2], "b": ["x", "x", "x", "y"]}, columns=["a", "b"])
+
+		codes, keys = encode_keys(df, ["a", "b"])
+
+		self.assertEqual(codes[0], codes[2])
+		self.assertEqual(len(set(codes)), 3)
+		self.assertEqual(sorted(keys), [(1, "x"), (2, "x"), (2, "y")])
+		self.assertEqual([keys[code] for code in codes], [(1, "x"), (2, "x"), (1, "x"), (2, "y")])
+
+	def test_nulls(self):
+		"""
+			NaN and None in the file are the null of the database
+		"""
+		df = pd.DataFrame({
+			"FlightNum": [1, 1, 2],
+			"TailNum": [np.nan, None, "N100"]
+		}, columns=["FlightNum", "TailNum"])
+
+		self.assertEqual(get_index().resolve(df, ["FlightNum", "TailNum"]).tolist(), [10, 10, 11])
+
+	def test_categorical(self):
+		"""
+			Categorical columns of the file (see raw.flight_schema) against the int / text keys of the database
+		"""
+		df = pd.DataFrame({
+			"FlightNum": pd.Series([2, 2, 1], dtype="category"),
+			"TailNum": pd.Series(["N200", "N100", None], dtype="category")
+		}, columns=["FlightNum", "TailNum"])
+
+		self.assertEqual(get_index().resolve(df, ["FlightNum", "TailNum"]).tolist(), [12, 11, 10])
+
+	def test_miss(self):
+		df = pd.DataFrame({"FlightNum": [2, 3], "TailNum": ["N300", "N100"]}, columns=["FlightNum", "TailNum"])
+
+		self.assertEqual(get_index().resolve(df, ["FlightNum", "TailNum"]).tolist(), [-1, -1])
+
+	def test_duplicated_key(self):
+		index = get_index()
+
+		with self.assertRaises(ValueError):
+			index.add(pd.DataFrame({"sk_flight": [13], "flight_number": [2], "tail_number": ["N100"]}))
+
+	def test_max_sk(self):
+		index = get_index()
+		index.add(pd.DataFrame({"sk_flight": [20], "flight_number": [3], "tail_number": ["N300"]}))
+
+		self.assertEqual(index.max_sk, 20)
+		self.assertEqual(len(index), 4)
+
+
+if __name__ == "__main__":
+	unittest.main()
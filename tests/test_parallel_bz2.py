@@ -0,0 +1,80 @@
+import bz2
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from raw.parallel_bz2 import ParallelBz2Reader, blocks_to_stream, find_blocks
+from raw.raw_data import rechunk
+
+ROWS = 200000
+# explicit types, as the year file is read (see raw.flight_schema)
+DTYPE = {"carrier": object}
+
+
+class ParallelBz2ReaderTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+			A csv of about 5 MB, compressed with 900k blocks (level 9), so the file has several blocks
+		"""
+		rng = np.random.RandomState(0)
+		cls.tmp_dir = tempfile.mkdtemp()
+		cls.file_path = os.path.join(cls.tmp_dir, "flights.csv.bz2")
+		cls.df = pd.DataFrame({
+			"id": np.arange(ROWS),
+			"carrier": rng.choice(["AA", "DL", "UA", "WN"], ROWS),
+			"delay": rng.randint(-30, 300, ROWS),
+			"distance": rng.random_sample(ROWS).round(3)
+		}, columns=["id", "carrier", "delay", "distance"])
+		with bz2.open(cls.file_path, "wb", compresslevel=9) as f:
+			f.write(cls.df.to_csv(index=False).encode("utf-8"))
+
+	@classmethod
+	def tearDownClass(cls):
+		shutil.rmtree(cls.tmp_dir)
+
+	def read(self, **params):
+		return list(ParallelBz2Reader(
+			self.file_path, processes=2, blocks_per_task=1, sep=",", dtype=DTYPE, **params))
+
+	def test_blocks(self):
+		blocks = find_blocks(self.file_path)
+		self.assertGreater(len(blocks), 4)
+
+		# each range of blocks is a valid stream and all of them are the file
+		data = [bz2.decompress(blocks_to_stream(self.file_path, [block])) for block in blocks]
+		with bz2.open(self.file_path, "rb") as f:
+			self.assertEqual(b"".join(data), f.read())
+		# the test needs lines broken between blocks
+		self.assertTrue(any(not block.endswith(b"\n") for block in data[:-1]))
+
+	def test_ordered(self):
+		df = pd.concat(self.read(ordered=True), ignore_index=True)
+
+		pd.testing.assert_frame_equal(df, pd.read_csv(self.file_path, dtype=DTYPE))
+
+	def test_unordered(self):
+		df = pd.concat(self.read(ordered=False), ignore_index=True)
+		df = df.sort_values("id").reset_index(drop=True)
+
+		pd.testing.assert_frame_equal(df, pd.read_csv(self.file_path, dtype=DTYPE))
+
+	def test_rechunk(self):
+		"""
+			In file order the chunks are cut to the size of the serial reader (the positions of a checkpoint)
+		"""
+		chunks = list(rechunk(self.read(ordered=True), 50000))
+		serial = list(pd.read_csv(self.file_path, dtype=DTYPE, chunksize=50000))
+
+		self.assertEqual([len(df) for df in chunks], [len(df) for df in serial])
+		for df, df_serial in zip(chunks, serial):
+			pd.testing.assert_frame_equal(df, df_serial.reset_index(drop=True))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,113 @@
+import struct
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from util.pg_binary import HEADER, NULL_FIELD, TRAILER, df_to_pg_binary
+
+
+def decode(data, pg_types):
+	"""
+		Reads a postgres binary COPY back to a list of rows (None for nulls)
+	"""
+	formats = {"int2": ">h", "int4": ">i", "int8": ">q", "float4": ">f", "float8": ">d"}
+	assert data.startswith(HEADER) and data.endswith(TRAILER)
+
+	rows = []
+	pos = len(HEADER)
+	while pos < len(data) - len(TRAILER):
+		count, = struct.unpack_from(">h", data, pos)
+		assert count == len(pg_types)
+		pos += 2
+		row = []
+		for pg_type in pg_types:
+			length, = struct.unpack_from(">i", data, pos)
+			pos += 4
+			if length == -1:
+				row.append(None)
+				continue
+			field = data[pos:pos + length]
+			pos += length
+			if pg_type == "text":
+				row.append(field.decode("utf-8"))
+			else:
+				assert length == struct.calcsize(formats[pg_type])
+				row.append(struct.unpack(formats[pg_type], field)[0])
+		rows.append(row)
+
+	assert pos == len(data) - len(TRAILER)
+	return rows
+
+
+class PgBinaryTest(unittest.TestCase):
+
+	def test_header(self):
+		data = df_to_pg_binary(pd.DataFrame({"a": []}), ["a"], ["int4"])
+
+		self.assertEqual(data[:11], b"PGCOPY\n\xff\r\n\x00")
+		self.assertEqual(struct.unpack(">ii", data[11:19]), (0, 0))
+		self.assertEqual(data[19:], struct.pack(">h", -1))
+
+	def test_fixed_types(self):
+		df = pd.DataFrame({
+			"small": np.array([1, -2], dtype=np.int16),
+			"int": np.array([70000, -3], dtype=np.int32),
+			"big": np.array([2 ** 40, -4], dtype=np.int64),
+			"float": np.array([1.5, -0.25], dtype=np.float32)
+		})
+		types = ["int2", "int4", "int8", "float4"]
+
+		self.assertEqual(
+			decode(df_to_pg_binary(df, ["small", "int", "big", "float"], types), types),
+			[[1, 70000, 2 ** 40, 1.5], [-2, -3, -4, -0.25]])
+
+	def test_nulls_and_text(self):
+		df = pd.DataFrame({
+			"int": pd.Series([1, None, 3], dtype=object),
+			"float": [0.5, 1.25, None],
+			"text": ["São Paulo", None, ""]
+		})
+		types = ["int4", "float8", "text"]
+
+		self.assertEqual(
+			decode(df_to_pg_binary(df, ["int", "float", "text"], types), types),
+			[[1, 0.5, "São Paulo"], [None, 1.25, None], [3, None, ""]])
+
+	def test_date_and_time(self):
+		"""
+			date: days since 2000-01-01 (int4), time: microseconds since midnight (int8)
+		"""
+		df = pd.DataFrame({
+			"full_date": pd.to_datetime(["2000-01-01", "2008-01-01", "1999-12-31"]),
+			"departure": np.array([0, 3600 + 30 * 60, 86399], dtype=np.int32)
+		}, columns=["full_date", "departure"])
+
+		expected = b"".join(
+			struct.pack(">hii", 2, 4, days) + struct.pack(">iq", 8, microseconds)
+			for days, microseconds in [(0, 0), (2922, 5400000000), (-1, 86399000000)])
+		self.assertEqual(df_to_pg_binary(df, ["full_date", "departure"], ["date", "time"]), HEADER + expected + TRAILER)
+
+	def test_date_and_time_with_nulls(self):
+		df = pd.DataFrame({
+			"full_date": pd.to_datetime(["2008-01-02", None]),
+			"departure": pd.Series(["0:05", None], dtype=object),
+			"arrival": pd.to_timedelta([None, "23:59:00"])
+		}, columns=["full_date", "departure", "arrival"])
+
+		expected = (
+			struct.pack(">hii", 3, 4, 2923) + struct.pack(">iq", 8, 300000000) + NULL_FIELD +
+			struct.pack(">h", 3) + NULL_FIELD + NULL_FIELD + struct.pack(">iq", 8, 86340000000))
+		self.assertEqual(
+			df_to_pg_binary(df, ["full_date", "departure", "arrival"], ["date", "time", "time"]),
+			HEADER + expected + TRAILER)
+
+	def test_unsupported_type(self):
+		df = pd.DataFrame({"loaded_at": [pd.Timestamp("2008-01-01")]})
+
+		with self.assertRaises(ValueError):
+			df_to_pg_binary(df, ["loaded_at"], ["timestamp"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,93 @@
+import threading
+import time
+import unittest
+
+import pandas as pd
+
+from util.pipeline import ChunkPipeline
+
+CHUNKS = 20
+
+
+def source(fail_at=None):
+	for i in range(CHUNKS):
+		if i == fail_at:
+			raise ValueError("read failed")
+		yield pd.DataFrame({"chunk": [i] * (i + 1)})
+
+
+def slow_work(df):
+	"""
+		The first chunks are the slowest, so the workers finish them out of order
+	"""
+	time.sleep(0.002 * (CHUNKS - df["chunk"].iloc[0]))
+	return df
+
+
+class ChunkPipelineTest(unittest.TestCase):
+
+	def run_pipeline(self, pipeline):
+		"""
+			Runs the pipeline in a thread: a stage that does not stop fails the test instead of hanging it
+		:return: error raised by run (or None)
+		"""
+		errors = []
+
+		def run():
+			try:
+				pipeline.run()
+			except Exception as e:
+				errors.append(e)
+
+		thread = threading.Thread(target=run)
+		thread.start()
+		thread.join(timeout=30)
+		self.assertFalse(thread.is_alive(), "the pipeline did not stop")
+		self.assertEqual([t.name for t in threading.enumerate() if t.name.startswith(pipeline.name)], [])
+
+		return errors[0] if errors else None
+
+	def test_order(self):
+		written = []
+		pipeline = ChunkPipeline(
+			source(), work=slow_work, write=lambda df: written.append(df["chunk"].iloc[0]), workers=4,
+			queue_depth=2, name="OrderTest")
+
+		self.assertIsNone(self.run_pipeline(pipeline))
+		self.assertEqual(written, list(range(CHUNKS)))
+		self.assertEqual([stats.chunks for stats in pipeline.stats], [CHUNKS] * 3)
+		self.assertEqual(pipeline.stats[2].rows, sum(range(1, CHUNKS + 1)))
+
+	def test_reader_error(self):
+		pipeline = ChunkPipeline(source(fail_at=5), work=slow_work, write=lambda df: None, workers=3, name="ReadTest")
+
+		error = self.run_pipeline(pipeline)
+		self.assertIsInstance(error, ValueError)
+		self.assertEqual(str(error), "read failed")
+
+	def test_worker_error(self):
+		def work(df):
+			if df["chunk"].iloc[0] == 7:
+				raise KeyError("work failed")
+			return slow_work(df)
+
+		pipeline = ChunkPipeline(source(), work=work, write=lambda df: None, workers=3, queue_depth=1, name="WorkTest")
+
+		self.assertIsInstance(self.run_pipeline(pipeline), KeyError)
+
+	def test_writer_error(self):
+		written = []
+
+		def write(df):
+			if df["chunk"].iloc[0] == 3:
+				raise IOError("write failed")
+			written.append(df["chunk"].iloc[0])
+
+		pipeline = ChunkPipeline(source(), work=slow_work, write=write, workers=3, queue_depth=1, name="WriteTest")
+
+		self.assertIsInstance(self.run_pipeline(pipeline), IOError)
+		self.assertEqual(written, [0, 1, 2])
+
+
+if __name__ == "__main__":
+	unittest.main()
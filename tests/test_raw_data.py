@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from raw.flight_schema import CODE_COLUMNS, FILE_COLUMNS
+from raw.raw_data import get_cache_schema, read_cache
+
+ROWS = 130000
+GROUP_ROWS = 50000
+
+
+class ReadCacheTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+			A cache as written by cache_flight_arrival_data: one row group per chunk of 50000 rows
+		"""
+		cls.tmp_dir = tempfile.mkdtemp()
+		cls.cache_path = os.path.join(cls.tmp_dir, "2008.parquet")
+		cls.df = pd.DataFrame({
+			col: np.where(np.arange(ROWS) % 2 == 0, "AA", "DL").astype(object) if col in CODE_COLUMNS else
+			(np.arange(ROWS) % 100).astype("int8")
+			for col in FILE_COLUMNS
+		}, columns=FILE_COLUMNS)
+		cls.df["DayofMonth"] = (np.arange(ROWS) // GROUP_ROWS).astype("int8")
+
+		schema = get_cache_schema()
+		writer = pq.ParquetWriter(cls.cache_path, schema)
+		for start in range(0, ROWS, GROUP_ROWS):
+			df = cls.df.iloc[start:start + GROUP_ROWS]
+			writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+		writer.close()
+
+	@classmethod
+	def tearDownClass(cls):
+		shutil.rmtree(cls.tmp_dir)
+
+	def read(self, chunksize, skip_rows=0):
+		return list(read_cache(
+			self.cache_path, usecols=["DayofMonth", "UniqueCarrier"], chunksize=chunksize, skip_rows=skip_rows))
+
+	def assert_rows(self, chunks, skip_rows):
+		df = pd.concat([chunk.astype({"UniqueCarrier": object}) for chunk in chunks], ignore_index=True)
+		expected = self.df[["DayofMonth", "UniqueCarrier"]].iloc[skip_rows:].reset_index(drop=True)
+		pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+	def test_row_groups(self):
+		chunks = self.read(GROUP_ROWS)
+
+		self.assertEqual([len(df) for df in chunks], [50000, 50000, 30000])
+		self.assert_rows(chunks, 0)
+
+	def test_skip_rows(self):
+		"""
+			The chunks after a checkpoint are those of the csv readers, not the rest of a row group
+		"""
+		chunks = self.read(GROUP_ROWS, skip_rows=70000)
+
+		self.assertEqual([len(df) for df in chunks], [50000, 10000])
+		self.assert_rows(chunks, 70000)
+
+	def test_chunksize(self):
+		chunks = self.read(40000, skip_rows=20000)
+
+		self.assertEqual([len(df) for df in chunks], [40000, 40000, 30000])
+		self.assert_rows(chunks, 20000)
+		self.assertTrue(all(df["UniqueCarrier"].dtype.name == "category" for df in chunks))
+
+
+if __name__ == "__main__":
+	unittest.main()
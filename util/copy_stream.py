@@ -0,0 +1,100 @@
+import io
+from itertools import chain
+
+import pandas as pd
+
+from util.pg_binary import HEADER, TRAILER, check_types, encode_body
+
+
+def iter_slices(df: pd.DataFrame, rows):
+	for start in range(0, len(df), rows):
+		yield df.iloc[start:start + rows]
+
+
+class CopyStream(io.RawIOBase):
+	"""
+		Read only file-like object over an iterator of bytes parts, used as the source of a COPY FROM STDIN.
+		The parts are only generated when psycopg2 reads them, so serialization and the server ingest
+		overlap and only one part is in memory at a time.
+	"""
+
+	def __init__(self, parts):
+		"""
+		:param parts: Iterator of bytes
+		"""
+		super().__init__()
+		self.__parts = iter(parts)
+		self.__buffer = b""
+		self.__position = 0
+		self.bytes_read = 0
+
+	def readable(self):
+		return True
+
+	def __next_part(self):
+		"""
+			Replaces the consumed buffer by the next part.
+		:return: False if there are no more parts
+		"""
+		part = next(self.__parts, None)
+		if part is None:
+			return False
+
+		self.__buffer, self.__position = part, 0
+		return True
+
+	def __read(self, size, stop_at_newline):
+		chunks = []
+		while size != 0:
+			if self.__position >= len(self.__buffer):
+				if not self.__next_part():
+					break
+				continue
+
+			end = len(self.__buffer)
+			if stop_at_newline:
+				end = self.__buffer.find(b"\n", self.__position) + 1 or end
+			if size > 0:
+				end = min(end, self.__position + size)
+				size -= end - self.__position
+
+			chunks.append(self.__buffer[self.__position:end])
+			self.__position = end
+			if stop_at_newline and chunks[-1].endswith(b"\n"):
+				break
+
+		data = b"".join(chunks)
+		self.bytes_read += len(data)
+		return data
+
+	def read(self, size=-1):
+		return self.__read(size, stop_at_newline=False)
+
+	def readline(self, size=-1):
+		return self.__read(size, stop_at_newline=True)
+
+	@classmethod
+	def from_df_text(
+			cls, df: pd.DataFrame, sep=";", header=False, index=False, df_columns=None, encoding="utf-8",
+			buffer_rows=5000):
+		"""
+			Text (csv) rows of a dataframe, serialized 'buffer_rows' rows at a time.
+		"""
+		return cls(
+			df_slice.to_csv(
+				sep=sep, header=header and start == 0, index=index, columns=df_columns).encode(encoding)
+			for start, df_slice in zip(range(0, len(df), buffer_rows), iter_slices(df, buffer_rows))
+		)
+
+	@classmethod
+	def from_df_binary(cls, df: pd.DataFrame, df_columns, pg_types, buffer_rows=5000):
+		"""
+			Postgres binary COPY rows of a dataframe, serialized 'buffer_rows' rows at a time.
+			The types are checked here, before the COPY starts reading the stream.
+		"""
+		check_types(df_columns, pg_types)
+		return cls(chain(
+			[HEADER],
+			(encode_body(df_slice, df_columns, pg_types) for df_slice in iter_slices(df, buffer_rows)),
+			[TRAILER]
+		))
@@ -0,0 +1,159 @@
+import logging
+import queue
+import threading
+import time
+
+from util.utils import get_metrics
+
+STOP = object()
+
+
+class CopyWriterPool:
+	"""
+		Pool of writer threads, each one with its own persistent connection and COPY stream.
+		The chunks are spread across the connections and each chunk is committed by itself.
+
+		Every chunk receives a sequence number (submit order). A chunk that fails is retried (with a new
+		connection if the old one is broken) and, if it still fails, it is reported by 'failed' and 'close'.
+		'watermark' is the last sequence number such that it and all the chunks before it are committed,
+		so a run can be resumed from the chunk after it without losing the order of the load.
+	"""
+
+	def __init__(
+			self, db_client, connections=4, retries=1, stop_on_error=True, before_commit=None,
+			name="CopyWriterPool", stage=None):
+		"""
+		:param db_client: PostgresClient
+		:param connections: Number of connections (and writer threads)
+		:param retries: Number of retries of a failed chunk
+		:param stop_on_error: Skips the chunks not written yet when a chunk fails after all the retries
+		:param before_commit: function(cursor, seq, df, context) called after the COPY, in the same transaction
+		:param name: Name used in the log
+		:param stage: Stage of the COPY metrics (see util.metrics, default: name)
+		"""
+		if connections >= db_client.get_max_connections():
+			raise ValueError(
+				"{} - {} connections, but the engine allows {} and the load needs some of them for the lookups. "
+				"Use fewer writers.".format(name, connections, db_client.get_max_connections()))
+
+		self.db_client = db_client
+		self.connections = connections
+		self.retries = retries
+		self.stop_on_error = stop_on_error
+		self.before_commit = before_commit
+		self.name = name
+		self.stage = stage or name
+		self.failed = {}
+		self.chunks_committed = 0
+		self.bytes_copied = 0
+		self.__queue = queue.Queue(maxsize=2 * connections)
+		self.__committed = set()
+		self.__next_seq = 0
+		self.__watermark = -1
+		self.__lock = threading.Lock()
+		self.__stop = threading.Event()
+		self.__threads = [
+			threading.Thread(target=self.__write, name="{}-{}".format(name, i)) for i in range(connections)]
+		for thread in self.__threads:
+			thread.daemon = True
+			thread.start()
+
+	def submit(self, df, context=None, **copy_params):
+		"""
+			Queues one chunk to be copied. Blocks while all the connections are busy and the queue is full.
+		:param df: Dataframe
+		:param context: Any data of the chunk, passed to before_commit
+		:param copy_params: Parameters of PostgresClient.copy_df_to_table (table_name, columns, etc)
+		:return: Sequence number of the chunk
+		"""
+		if self.__stop.is_set():
+			raise ValueError("{} - stopped after the failure of the chunks {}".format(
+				self.name, sorted(self.failed.keys())))
+
+		with self.__lock:
+			seq = self.__next_seq
+			self.__next_seq += 1
+
+		self.__queue.put((seq, df, context, copy_params))
+		return seq
+
+	def watermark(self):
+		"""
+		:return: Last sequence number committed with all the previous ones also committed (-1 if none)
+		"""
+		with self.__lock:
+			return self.__watermark
+
+	def __commit(self, seq, nbytes):
+		with self.__lock:
+			self.__committed.add(seq)
+			self.chunks_committed += 1
+			self.bytes_copied += nbytes
+			while self.__watermark + 1 in self.__committed:
+				self.__watermark += 1
+				self.__committed.remove(self.__watermark)
+
+	def __copy(self, conn, seq, df, context, copy_params):
+		# the rows of a failed attempt are not counted, only its time
+		with get_metrics().measure(self.stage, "copy") as measure:
+			cursor = conn.cursor()
+			measure.bytes = self.db_client.copy_df_to_table(df=df, cursor=cursor, **copy_params)
+			if self.before_commit is not None:
+				self.before_commit(cursor, seq, df, context)
+			conn.commit()
+			measure.rows = len(df)
+
+		return measure.bytes
+
+	def __write(self):
+		conn = None
+		try:
+			while True:
+				item = self.__queue.get()
+				if item is STOP:
+					break
+
+				seq, df, context, copy_params = item
+				if self.__stop.is_set():
+					continue
+
+				for attempt in range(self.retries + 1):
+					try:
+						if conn is None:
+							conn = self.db_client.get_conn_engine().raw_connection()
+						self.__commit(seq, self.__copy(conn, seq, df, context, copy_params))
+						break
+					except Exception as e:
+						logging.warning("{} - chunk {} failed (attempt {}): {}".format(self.name, seq, attempt + 1, e))
+						try:
+							conn.rollback()
+						except Exception:
+							if conn is not None:
+								conn.invalidate()
+							conn = None
+						if attempt == self.retries:
+							with self.__lock:
+								self.failed[seq] = e
+							if self.stop_on_error:
+								self.__stop.set()
+		finally:
+			if conn is not None and not conn.closed:
+				conn.close()
+
+	def close(self, raise_errors=True):
+		"""
+			Waits for all the chunks queued and closes the connections.
+		:param raise_errors: Raises ValueError if any chunk failed
+		"""
+		start_time = time.time()
+		for _ in self.__threads:
+			self.__queue.put(STOP)
+		for thread in self.__threads:
+			thread.join()
+
+		logging.info("{} - {} chunks committed, {} bytes, waited {:.2f} s to close".format(
+			self.name, self.chunks_committed, self.bytes_copied, time.time() - start_time))
+
+		if raise_errors and self.failed:
+			raise ValueError("{} - failed chunks: {}. All the chunks up to {} were committed.".format(
+				self.name, sorted(self.failed.keys()), self.watermark()))
@@ -0,0 +1,92 @@
+import threading
+
+import pandas as pd
+
+from util.key_index import KeyIndex
+
+
+class DimensionCache:
+	"""
+		In memory index of the dimensions (natural key -> surrogate key), shared by the whole process.
+		Each dimension is read only once from the database. After a save, only the records with a
+		surrogate key greater than the last cached one are read and added.
+		Dimensions saved with upsert (see BaseDimension.upsert_members) are not read: the members returned by
+		the upsert (sk and natural key) are added directly. Those indexes only have the keys upserted by this
+		process, so the members of other processes rely on the refresh after a lookup miss (see refresh).
+	"""
+
+	def __init__(self, db_client):
+		"""
+		:param db_client: PostgresClient
+		"""
+		self.db_client = db_client
+		self.__dimensions = {}
+		self.__members = {}
+		self.__lock = threading.Lock()
+
+	def __query(self, dim_table_name, sk_name, dim_columns, min_sk=None):
+		sql = "SELECT {}, {} FROM {}".format(sk_name, ", ".join(dim_columns), dim_table_name)
+		params = None
+		if min_sk is not None:
+			sql += " WHERE {} > %(min_sk)s".format(sk_name)
+			params = {"min_sk": int(min_sk)}
+
+		return pd.read_sql_query(sql=sql, con=self.db_client.get_conn_engine(), params=params)
+
+	def get(self, dim_table_name, sk_name, dim_columns) -> KeyIndex:
+		"""
+			Returns the dimension index, querying the database only at the first call.
+		:param dim_table_name: Dimension table
+		:param sk_name: Surrogate key of the dimension
+		:param dim_columns: Natural key columns
+		:return: KeyIndex
+		"""
+		key = (dim_table_name, sk_name, tuple(dim_columns))
+		with self.__lock:
+			if key not in self.__dimensions:
+				index = KeyIndex(sk_name, dim_columns)
+				if dim_table_name in self.__members:
+					for df in self.__members[dim_table_name]:
+						index.add(df)
+				else:
+					index.add(self.__query(dim_table_name, sk_name, dim_columns))
+				self.__dimensions[key] = index
+
+			return self.__dimensions[key]
+
+	def update(self, dim_table_name):
+		"""
+			Adds the new members of a dimension (already committed) to the cached indexes.
+			Dimensions not cached yet are ignored: they will be fully read at the first 'get'.
+		:param dim_table_name: Dimension table
+		"""
+		with self.__lock:
+			for key, index in self.__dimensions.items():
+				if key[0] == dim_table_name:
+					index.add(self.__query(dim_table_name, index.sk_name, index.columns, min_sk=index.max_sk))
+
+	def add(self, dim_table_name, df):
+		"""
+			Adds the members returned by an upsert to the cached indexes of the dimension. From now on, the
+			indexes of this dimension are built with these members, without reading the table.
+		:param dim_table_name: Dimension table
+		:param df: Dataframe with the sk and the natural key columns
+		"""
+		with self.__lock:
+			self.__members.setdefault(dim_table_name, []).append(df)
+			for key, index in self.__dimensions.items():
+				if key[0] == dim_table_name:
+					index.add(df)
+
+	def refresh(self, dim_table_name, sk_name, dim_columns) -> KeyIndex:
+		"""
+			Reads the whole dimension again (e.g. after a lookup miss, when other processes load the same
+			dimension).
+		:return: KeyIndex
+		"""
+		index = KeyIndex(sk_name, dim_columns)
+		index.add(self.__query(dim_table_name, sk_name, dim_columns))
+		with self.__lock:
+			self.__dimensions[(dim_table_name, sk_name, tuple(dim_columns))] = index
+
+		return index
@@ -0,0 +1,353 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import http.client
+import io
+import json
+import logging
+import os
+import shutil
+import time
+import urllib.error
+import urllib.request
+
+BUFFER_SIZE = 1024 * 1024
+
+
+def sha256_file(file_path):
+	"""
+		sha256 of a file
+	:return: Hex digest
+	"""
+	sha = hashlib.sha256()
+	with open(file_path, "rb") as f:
+		for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+			sha.update(block)
+
+	return sha.hexdigest()
+
+
+class DownloadManager:
+	"""
+		Downloads files to a local content addressed cache:
+		- objects/[sha256]: the downloaded files, named by their checksum;
+		- urls/[key].json: the object of each url, with its ETag / Last-Modified;
+		- parts/[key].part: downloads not finished yet.
+
+		A url already in the cache is requested again only with If-None-Match / If-Modified-Since, so an unchanged
+		file is not downloaded. An interrupted download is resumed with an HTTP Range request (If-Range makes the
+		server send the whole file again if it has changed). The checksum of every download is computed and, when
+		informed, verified. The target file is a hard link to the object (a copy if links are not supported).
+	"""
+
+	def __init__(self, cache_dir, retries=3, timeout=60):
+		"""
+		:param cache_dir: Cache directory
+		:param retries: Attempts after a network error (each one resumes the download)
+		:param timeout: Socket timeout (seconds)
+		"""
+		self.cache_dir = cache_dir
+		self.retries = retries
+		self.timeout = timeout
+		for sub_dir in ["objects", "urls", "parts"]:
+			os.makedirs(os.path.join(cache_dir, sub_dir), exist_ok=True)
+
+	@staticmethod
+	def get_url_key(url):
+		return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+	def get_object_path(self, sha256):
+		return os.path.join(self.cache_dir, "objects", sha256)
+
+	def get_part_path(self, url):
+		return os.path.join(self.cache_dir, "parts", "{}.part".format(self.get_url_key(url)))
+
+	def read_entry(self, path):
+		if not os.path.exists(path):
+			return None
+		with open(path) as f:
+			return json.load(f)
+
+	def write_entry(self, path, entry):
+		"""
+			Writes a json file atomically (other processes may read it)
+		"""
+		with open(path + ".tmp", "w") as f:
+			json.dump(entry, f, indent=1)
+		os.replace(path + ".tmp", path)
+
+	def get_entry_path(self, url):
+		return os.path.join(self.cache_dir, "urls", "{}.json".format(self.get_url_key(url)))
+
+	def is_valid(self, entry):
+		"""
+			Checks if the object of a cache entry exists and was not changed. The checksum is computed again only
+			if the size or the modification time of the object are not the ones of the entry.
+		"""
+		if entry is None:
+			return False
+
+		object_path = self.get_object_path(entry["sha256"])
+		if not os.path.exists(object_path):
+			return False
+
+		stat = os.stat(object_path)
+		if stat.st_size != entry["size"]:
+			return False
+		if stat.st_mtime != entry.get("mtime") and sha256_file(object_path) != entry["sha256"]:
+			return False
+
+		return True
+
+	def open_url(self, url, headers):
+		"""
+			GET request
+		:return: response, or None if the server answered 304 (not modified)
+		"""
+		try:
+			return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout)
+		except urllib.error.HTTPError as e:
+			if e.code == 304:
+				return None
+			raise
+
+	def request(self, url, entry=None):
+		"""
+			Opens the download of a url, resuming its part file.
+		:param entry: Valid cache entry of the url (for a conditional request)
+		:return: (response, part file, offset, total size, validators of the response) or None if the cached
+		object is still current. The response must be appended to the part file if offset > 0.
+		"""
+		part_path = self.get_part_path(url)
+		part_meta_path = part_path + ".json"
+		part_meta = self.read_entry(part_meta_path)
+		offset = os.path.getsize(part_path) if os.path.exists(part_path) and part_meta is not None else 0
+
+		headers = {}
+		if entry is not None:
+			if entry.get("etag"):
+				headers["If-None-Match"] = entry["etag"]
+			if entry.get("last_modified"):
+				headers["If-Modified-Since"] = entry["last_modified"]
+		if offset > 0 and (part_meta.get("etag") or part_meta.get("last_modified")):
+			headers["Range"] = "bytes={}-".format(offset)
+			headers["If-Range"] = part_meta.get("etag") or part_meta.get("last_modified")
+
+		try:
+			response = self.open_url(url, headers)
+		except urllib.error.HTTPError as e:
+			if e.code != 416:
+				raise
+			# the part is not a prefix of the file anymore
+			os.remove(part_path)
+			return self.request(url, entry)
+		if response is None:
+			return None
+
+		validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+		if response.status == 206:
+			total = int(response.headers["Content-Range"].split("/")[-1])
+			logging.info("DownloadManager - {} - resuming at {} of {} bytes".format(url, offset, total))
+		else:
+			length = response.headers.get("Content-Length")
+			total = int(length) if length is not None else None
+			offset = 0
+			self.write_entry(part_meta_path, validators)
+
+		return response, part_path, offset, total, validators
+
+	@staticmethod
+	def check_size(url, part_path, total):
+		size = os.path.getsize(part_path)
+		if total is not None and size != total:
+			raise IOError("Incomplete download of {}: {} of {} bytes".format(url, size, total))
+
+	def fetch(self, url, entry=None):
+		"""
+			Downloads a url to its part file, resuming what is already there.
+		:param entry: Valid cache entry of the url (for a conditional request)
+		:return: (part file, validators of the response) or None if the cached object is still current
+		"""
+		download = self.request(url, entry)
+		if download is None:
+			return None
+
+		response, part_path, offset, total, validators = download
+		with response, open(part_path, "ab" if offset > 0 else "wb") as f:
+			shutil.copyfileobj(response, f, BUFFER_SIZE)
+		self.check_size(url, part_path, total)
+
+		return part_path, validators
+
+	def store(self, url, part_path, validators, sha256=None):
+		"""
+			Moves a finished download to the objects, after verifying its checksum
+		:return: Cache entry
+		"""
+		digest = sha256_file(part_path)
+		if sha256 is not None and digest != sha256.lower():
+			os.remove(part_path)
+			raise ValueError("Checksum of {} is {}, expected {}".format(url, digest, sha256))
+
+		object_path = self.get_object_path(digest)
+		os.replace(part_path, object_path)
+		part_meta_path = part_path + ".json"
+		if os.path.exists(part_meta_path):
+			os.remove(part_meta_path)
+
+		stat = os.stat(object_path)
+		entry = dict(validators, url=url, sha256=digest, size=stat.st_size, mtime=stat.st_mtime)
+		self.write_entry(self.get_entry_path(url), entry)
+
+		return entry
+
+	@staticmethod
+	def place(object_path, file_path):
+		"""
+			Links (or copies) an object to the target path
+		"""
+		if os.path.exists(file_path):
+			if os.path.samefile(object_path, file_path):
+				return
+			os.remove(file_path)
+
+		os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+		try:
+			os.link(object_path, file_path)
+		except OSError:
+			shutil.copy2(object_path, file_path)
+
+	def download(self, url, file_path, sha256=None):
+		"""
+			Downloads a url to a file, using the cache
+		:param url: Source url
+		:param file_path: Target file
+		:param sha256: Expected checksum (None only computes it)
+		:return: sha256 of the file
+		"""
+		start_time = time.time()
+		entry = self.get_cached_entry(url, sha256)
+
+		for attempt in range(self.retries + 1):
+			try:
+				result = self.fetch(url, entry)
+				break
+			except (IOError, http.client.HTTPException) as e:
+				if isinstance(e, urllib.error.HTTPError) or attempt == self.retries:
+					raise
+				logging.warning("DownloadManager - {} - {}, retrying".format(url, e))
+				time.sleep(2 ** attempt)
+
+		if result is None:
+			logging.info("DownloadManager - {} - not modified, using the cache".format(url))
+		else:
+			entry = self.store(url, result[0], result[1], sha256)
+			logging.info("DownloadManager - {} - {} bytes downloaded - {:.2f} s".format(
+				url, entry["size"], time.time() - start_time))
+
+		self.place(self.get_object_path(entry["sha256"]), file_path)
+
+		return entry["sha256"]
+
+	def get_cached_entry(self, url, sha256=None):
+		"""
+			Cache entry of a url, if its object is valid (and has the expected checksum)
+		"""
+		entry = self.read_entry(self.get_entry_path(url))
+		if not self.is_valid(entry) or (sha256 is not None and entry["sha256"] != sha256.lower()):
+			return None
+
+		return entry
+
+	def open_stream(self, url, file_path, sha256=None):
+		"""
+			Opens a url to be read while it is downloaded: the bytes read are also written to the part file and,
+			at the end of the response, the download is stored in the cache and placed in 'file_path' (as
+			'download' does). A part file of an interrupted download is read first and the rest of the file is
+			requested with a Range request. Network errors are not retried: the next download resumes the part.
+		:param url: Source url
+		:param file_path: Target file
+		:param sha256: Expected checksum (verified at the end of the response)
+		:return: Binary file object
+		"""
+		entry = self.get_cached_entry(url, sha256)
+		download = self.request(url, entry)
+		if download is None:
+			logging.info("DownloadManager - {} - not modified, using the cache".format(url))
+			self.place(self.get_object_path(entry["sha256"]), file_path)
+			return open(file_path, "rb")
+
+		return TeeReader(self, url, file_path, sha256, *download)
+
+	def download_all(self, downloads, threads=4):
+		"""
+			Downloads several files at the same time
+		:param downloads: list of (url, file_path) or (url, file_path, sha256)
+		:param threads: Max downloads at the same time
+		:return: list with the sha256 of each file
+		"""
+		with ThreadPoolExecutor(max_workers=max(1, min(threads, len(downloads)))) as executor:
+			return list(executor.map(lambda download: self.download(*download), downloads))
+
+
+class TeeReader(io.RawIOBase):
+	"""
+		Binary reader of a download (see DownloadManager.open_stream): returns the part file already downloaded
+		and then the response, writing the response to the part file. At the end of the response the download
+		is stored in the cache.
+	"""
+
+	def __init__(self, manager, url, file_path, sha256, response, part_path, offset, total, validators):
+		super().__init__()
+		self.manager = manager
+		self.url = url
+		self.file_path = file_path
+		self.sha256 = sha256
+		self.response = response
+		self.part_path = part_path
+		self.total = total
+		self.validators = validators
+		self.start_time = time.time()
+		self.__prefix = open(part_path, "rb") if offset > 0 else None
+		self.__part = open(part_path, "ab" if offset > 0 else "wb")
+		self.__finished = False
+
+	def readable(self):
+		return True
+
+	def readinto(self, buffer):
+		if self.__prefix is not None:
+			size = self.__prefix.readinto(buffer)
+			if size > 0:
+				return size
+			self.__prefix.close()
+			self.__prefix = None
+
+		size = self.response.readinto(buffer)
+		if size == 0:
+			self.finish()
+			return 0
+
+		self.__part.write(memoryview(buffer)[:size])
+		return size
+
+	def finish(self):
+		"""
+			End of the response: checks the size and stores the download
+		"""
+		if self.__finished:
+			return
+
+		self.__finished = True
+		self.__part.close()
+		self.manager.check_size(self.url, self.part_path, self.total)
+		entry = self.manager.store(self.url, self.part_path, self.validators, self.sha256)
+		self.manager.place(self.manager.get_object_path(entry["sha256"]), self.file_path)
+		logging.info("DownloadManager - {} - {} bytes streamed - {:.2f} s".format(
+			self.url, entry["size"], time.time() - self.start_time))
+
+	def close(self):
+		if not self.closed:
+			for f in [self.__prefix, self.__part, self.response]:
+				if f is not None:
+					f.close()
+		super().close()
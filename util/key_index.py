@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+
+def key_values(series: pd.Series):
+	"""
+		Column values as python objects, with None for every kind of null (NaN, None, NaT), so the same key
+		read from a file and from the database is equal and has the same hash.
+	:param series: Column
+	:return: list
+	"""
+	values = series.tolist()
+	for i in np.flatnonzero(series.isnull().values):
+		values[i] = None
+
+	return values
+
+
+def encode_keys(df: pd.DataFrame, columns: list):
+	"""
+		Encodes a composite key (one or more columns) into one compact integer code per row.
+		Each column is factorized and combined with the codes of the previous ones, so the codes are
+		always lower than the number of rows.
+	:param df: Dataframe
+	:param columns: Key columns
+	:return: (codes, keys) - row codes (numpy array) and the key tuple of each code
+	"""
+	codes = np.zeros(len(df), dtype=np.int64)
+	for col in columns:
+		col_codes, col_uniques = pd.factorize(df[col])
+		codes, _ = pd.factorize(codes * (len(col_uniques) + 1) + (col_codes + 1))
+
+	first_rows = np.unique(codes, return_index=True)[1]
+	keys = list(zip(*[key_values(df[col].iloc[first_rows]) for col in columns]))
+
+	return codes, keys
+
+
+class KeyIndex:
+	"""
+		Hash index of a dimension: natural key tuple -> surrogate key.
+	"""
+
+	def __init__(self, sk_name, columns):
+		"""
+		:param sk_name: Surrogate key column
+		:param columns: Natural key columns
+		"""
+		self.sk_name = sk_name
+		self.columns = list(columns)
+		self.max_sk = 0
+		self.__index = {}
+
+	def __len__(self):
+		return len(self.__index)
+
+	def add(self, df: pd.DataFrame):
+		"""
+			Adds dimension records to the index
+		:param df: Dataframe with the sk and the natural key columns
+		"""
+		keys = zip(*[key_values(df[col]) for col in self.columns])
+		sks = df[self.sk_name].tolist()
+		for key, sk in zip(keys, sks):
+			if self.__index.setdefault(key, sk) != sk:
+				raise ValueError(
+					"Duplicated key {} in dimension ({}). Lookup must be m:1".format(key, ", ".join(self.columns)))
+
+		if len(sks) > 0:
+			self.max_sk = max(self.max_sk, max(sks))
+
+	def resolve(self, df: pd.DataFrame, df_columns: list):
+		"""
+			Finds the surrogate key of each row. Only the distinct keys of the dataframe are searched in the
+			index, the result is expanded to all the rows by their codes.
+		:param df: Dataframe
+		:param df_columns: Dataframe columns with the natural key (same order of the index columns)
+		:return: numpy array with the sk of each row (-1 when the key is not in the dimension)
+		"""
+		codes, keys = encode_keys(df, df_columns)
+		sk_by_code = np.array([self.__index.get(key, -1) for key in keys], dtype=np.int64)
+
+		return sk_by_code[codes]
@@ -0,0 +1,196 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import logging
+import threading
+import time
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+if hasattr(time, "thread_time"):
+	thread_time = time.thread_time
+elif resource is not None and hasattr(resource, "RUSAGE_THREAD"):
+	def thread_time():
+		"""
+			CPU time (user + system) of the current thread, on linux before python 3.7
+		"""
+		usage = resource.getrusage(resource.RUSAGE_THREAD)
+		return usage.ru_utime + usage.ru_stime
+else:
+	# CPU time of the whole process: the measures of concurrent threads include each other
+	thread_time = time.process_time
+
+logger = logging.getLogger("metrics")
+
+
+class Measure:
+	"""
+		One measure of a phase of a stage (e.g. the COPY of one chunk of the fact)
+	"""
+
+	def __init__(self, stage, phase, rows=0, nbytes=0):
+		self.stage = stage
+		self.phase = phase
+		self.rows = rows
+		self.bytes = nbytes
+		self.wall = 0.0
+		self.cpu = 0.0
+		self.child_wall = 0.0
+		self.child_cpu = 0.0
+		# not recorded (e.g. the end of an iterator)
+		self.skip = False
+
+
+class Metrics:
+	"""
+		Rows, bytes, wall and CPU time of each phase (read, lookup, transform, copy...) of each stage (the loaders).
+		Every measure is logged as a json line by the logger "metrics" and added to the totals of its stage and
+		phase, logged as a table at the end of the run (see log_summary).
+
+		Measures can be nested, e.g. the dimensions processing a chunk while the fact reads it: the time of the inner
+		measures is not counted in the outer one, so the phases of a thread add up to its wall time.
+		Measures of different threads (pipeline, writer pool, stages) are independent.
+	"""
+
+	def __init__(self, log_measures=True):
+		"""
+		:param log_measures: Logs every measure (otherwise only the summary)
+		"""
+		self.log_measures = log_measures
+		self.start_time = time.time()
+		self.__totals = OrderedDict()
+		self.__lock = threading.Lock()
+		self.__local = threading.local()
+
+	def __get_stack(self):
+		if not hasattr(self.__local, "stack"):
+			self.__local.stack = []
+
+		return self.__local.stack
+
+	@contextmanager
+	def measure(self, stage, phase, rows=0, nbytes=0):
+		"""
+			Measures a block:
+
+			with get_metrics().measure("FlightArrivalFact", "copy", rows=len(df)) as measure:
+				measure.bytes = copy(...)
+		:param stage: Loader (e.g. class name)
+		:param phase: read, lookup, transform, copy...
+		:param rows: Rows processed (can be set on the measure inside the block)
+		:param nbytes: Bytes copied (can be set on the measure, see also add_bytes)
+		:return: Measure
+		"""
+		stack = self.__get_stack()
+		measure = Measure(stage, phase, rows, nbytes)
+		stack.append(measure)
+		start_time, start_cpu = time.time(), thread_time()
+		try:
+			yield measure
+		finally:
+			wall, cpu = time.time() - start_time, thread_time() - start_cpu
+			stack.pop()
+			if stack:
+				stack[-1].child_wall += wall
+				stack[-1].child_cpu += cpu
+
+			measure.wall = wall - measure.child_wall
+			measure.cpu = cpu - measure.child_cpu
+			if not measure.skip:
+				self.add(measure)
+
+	def measure_iter(self, stage, df_iter, phase="read"):
+		"""
+			Measures each chunk of a dataframe iterator
+		:return: Dataframe iterator
+		"""
+		df_iter = iter(df_iter)
+		while True:
+			with self.measure(stage, phase) as measure:
+				df = next(df_iter, None)
+				if df is None:
+					measure.skip = True
+				else:
+					measure.rows = len(df)
+			if df is None:
+				return
+			yield df
+
+	def add_bytes(self, nbytes):
+		"""
+			Adds bytes to the current measure of the thread (e.g. from the function that runs the COPY)
+		"""
+		stack = self.__get_stack()
+		if stack and nbytes:
+			stack[-1].bytes += nbytes
+
+	def add(self, measure):
+		with self.__lock:
+			totals = self.__totals.setdefault(
+				(measure.stage, measure.phase), {"calls": 0, "rows": 0, "bytes": 0, "wall": 0.0, "cpu": 0.0})
+			totals["calls"] += 1
+			totals["rows"] += measure.rows
+			totals["bytes"] += measure.bytes
+			totals["wall"] += measure.wall
+			totals["cpu"] += measure.cpu
+
+		if self.log_measures:
+			logger.info(json.dumps(OrderedDict([
+				("stage", measure.stage),
+				("phase", measure.phase),
+				("rows", measure.rows),
+				("bytes", measure.bytes),
+				("wall", round(measure.wall, 4)),
+				("cpu", round(measure.cpu, 4)),
+				("thread", threading.current_thread().name)
+			])))
+
+	def to_list(self):
+		"""
+			Totals of each stage and phase, grouped by stage (in the order they were first measured)
+		:return: list of dicts
+		"""
+		with self.__lock:
+			items = [
+				OrderedDict([("stage", stage), ("phase", phase)] + list(totals.items()))
+				for (stage, phase), totals in self.__totals.items()
+			]
+
+		stages = []
+		for item in items:
+			if item["stage"] not in stages:
+				stages.append(item["stage"])
+
+		return sorted(items, key=lambda item: stages.index(item["stage"]))
+
+	def log_summary(self, name="Metrics"):
+		"""
+			Logs the totals as a table and as one json line
+		:param name: Name of the run (e.g. the year)
+		"""
+		totals = self.to_list()
+		elapsed = time.time() - self.start_time
+		logger.info(json.dumps(OrderedDict([
+			("name", name),
+			("elapsed", round(elapsed, 4)),
+			("summary", [dict(item, wall=round(item["wall"], 4), cpu=round(item["cpu"], 4)) for item in totals])
+		])))
+
+		lines = ["{:<20} {:<10} {:>7} {:>11} {:>9} {:>9} {:>9} {:>10}".format(
+			"stage", "phase", "calls", "rows", "MB", "wall (s)", "cpu (s)", "rows/s")]
+		for item in totals:
+			lines.append("{:<20} {:<10} {:>7} {:>11} {:>9.1f} {:>9.2f} {:>9.2f} {:>10.0f}".format(
+				item["stage"], item["phase"], item["calls"], item["rows"], item["bytes"] / 1024 / 1024, item["wall"],
+				item["cpu"], item["rows"] / item["wall"] if item["wall"] > 0 else 0))
+		lines.append("elapsed {:.2f} s".format(elapsed))
+
+		for line in lines:
+			logging.info("{} - {}".format(name, line))
+
+	def reset(self):
+		with self.__lock:
+			self.__totals.clear()
+		self.start_time = time.time()
@@ -0,0 +1,142 @@
+import struct
+
+import numpy as np
+import pandas as pd
+
+HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+TRAILER = struct.pack(">h", -1)
+NULL_FIELD = struct.pack(">i", -1)
+PG_EPOCH = np.datetime64("2000-01-01", "D")
+
+# postgres binary type -> numpy big endian type
+FIXED_TYPES = {
+	"int2": ">i2",
+	"int4": ">i4",
+	"int8": ">i8",
+	"float4": ">f4",
+	"float8": ">f8",
+	"date": ">i4",
+	"time": ">i8"
+}
+# postgres types sent as utf-8 (varchar is "text" in util.pg_schema)
+TEXT_TYPES = ["text"]
+
+
+def time_to_microseconds(series: pd.Series):
+	"""
+		Postgres binary time: microseconds since midnight.
+		Accepts timedelta, integer (seconds since midnight) or "H:MM" strings.
+	"""
+	if series.dtype.kind == "m":
+		return series.values.astype("timedelta64[us]").astype(np.int64)
+	if series.dtype.kind in "iu":
+		return series.values.astype(np.int64) * 1000000
+
+	parts = series.astype(str).str.split(":", n=1, expand=True).astype(np.int64)
+	return (parts[0].values * 3600 + parts[1].values * 60) * 1000000
+
+
+def date_to_days(series: pd.Series):
+	"""
+		Postgres binary date: days since 2000-01-01.
+	"""
+	days = pd.to_datetime(series).values.astype("datetime64[D]")
+	return (days - PG_EPOCH).astype(np.int64)
+
+
+def fixed_values(series: pd.Series, pg_type):
+	if pg_type == "time":
+		return time_to_microseconds(series)
+	if pg_type == "date":
+		return date_to_days(series)
+	return series.values
+
+
+def check_types(df_columns, pg_types):
+	"""
+		Raises ValueError for the columns whose type has no binary encoder (e.g. timestamp)
+	"""
+	unsupported = [
+		"{} ({})".format(col, pg_type) for col, pg_type in zip(df_columns, pg_types)
+		if pg_type not in FIXED_TYPES and pg_type not in TEXT_TYPES
+	]
+	if unsupported:
+		raise ValueError("Binary COPY does not support the columns {}".format(", ".join(unsupported)))
+
+
+def encode_rows(series_list, pg_types):
+	"""
+		Binary rows of columns without nulls and only with fixed size types.
+		The whole chunk is written by numpy as one structured array (field count, then length and
+		value of each field), with no python objects per row.
+	"""
+	fields = [("count", ">i2")]
+	for i, pg_type in enumerate(pg_types):
+		fields += [("length{}".format(i), ">i4"), ("value{}".format(i), FIXED_TYPES[pg_type])]
+
+	rows = np.empty(len(series_list[0]), dtype=np.dtype(fields))
+	rows["count"] = len(series_list)
+	for i, (series, pg_type) in enumerate(zip(series_list, pg_types)):
+		rows["length{}".format(i)] = np.dtype(FIXED_TYPES[pg_type]).itemsize
+		rows["value{}".format(i)] = fixed_values(series, pg_type)
+
+	return rows.tobytes()
+
+
+def encode_column(series: pd.Series, pg_type):
+	"""
+		Binary fields (length + value) of each row of a column, with support for nulls and text.
+	:return: list of bytes
+	"""
+	fields = [NULL_FIELD] * len(series)
+	valid = np.flatnonzero(series.notnull().values)
+
+	if pg_type in FIXED_TYPES:
+		dtype = np.dtype([("length", ">i4"), ("value", FIXED_TYPES[pg_type])])
+		values = np.empty(len(valid), dtype=dtype)
+		values["length"] = dtype["value"].itemsize
+		values["value"] = fixed_values(series.iloc[valid], pg_type)
+		data = values.tobytes()
+		for n, i in enumerate(valid):
+			fields[i] = data[n * dtype.itemsize:(n + 1) * dtype.itemsize]
+	elif pg_type in TEXT_TYPES:
+		for i, value in zip(valid, series.iloc[valid].tolist()):
+			data = str(value).encode("utf-8")
+			fields[i] = struct.pack(">i", len(data)) + data
+	else:
+		raise ValueError("Binary COPY does not support the type {}".format(pg_type))
+
+	return fields
+
+
+def encode_body(df: pd.DataFrame, df_columns, pg_types):
+	"""
+		Binary rows of a dataframe, without the COPY header and trailer (so a big dataframe can be
+		encoded in slices).
+	:param df: Dataframe
+	:param df_columns: Columns of the dataframe (same order of the target table columns)
+	:param pg_types: Postgres type of each column (see util.pg_schema)
+	:return: bytes
+	"""
+	check_types(df_columns, pg_types)
+	series_list = [df[col] for col in df_columns]
+
+	if len(df) == 0:
+		return b""
+	if all(t in FIXED_TYPES for t in pg_types) and not any(s.isnull().values.any() for s in series_list):
+		return encode_rows(series_list, pg_types)
+
+	count = struct.pack(">h", len(series_list))
+	columns = [encode_column(series, pg_type) for series, pg_type in zip(series_list, pg_types)]
+	return b"".join(count + b"".join(row) for row in zip(*columns))
+
+
+def df_to_pg_binary(df: pd.DataFrame, df_columns, pg_types):
+	"""
+		Serializes a dataframe to the postgres binary COPY format.
+	:param df: Dataframe
+	:param df_columns: Columns of the dataframe (same order of the target table columns)
+	:param pg_types: Postgres type of each column (see util.pg_schema)
+	:return: bytes
+	"""
+	return HEADER + encode_body(df, df_columns, pg_types) + TRAILER
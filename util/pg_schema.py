@@ -0,0 +1,66 @@
+from collections import OrderedDict
+import os
+import re
+
+from definitions import ROOT_DIR
+
+SCHEMA_FILE = os.path.join(ROOT_DIR, "db", "sql", "FlightArrival_create.sql")
+
+# SQL type (as written in the create script) -> postgres binary type
+PG_TYPES = {
+	"serial": "int4",
+	"int": "int4",
+	"integer": "int4",
+	"smallint": "int2",
+	"bigint": "int8",
+	"real": "float4",
+	"date": "date",
+	"time": "time",
+	"timestamp": "timestamp",
+	"varchar": "text",
+	"text": "text"
+}
+
+tables = None
+
+
+def read_schema(file_path=SCHEMA_FILE):
+	"""
+		Reads the column types of all the tables of a create script.
+	:param file_path: SQL file with the CREATE TABLE statements
+	:return: dict - table name -> OrderedDict(column name -> postgres type)
+	"""
+	with open(file_path) as f:
+		sql = f.read()
+
+	result = {}
+	for match in re.finditer(r"CREATE (?:UNLOGGED )?TABLE (\w+) \((.*?)\n\)[^;]*;", sql, re.S):
+		columns = OrderedDict()
+		for line in match.group(2).splitlines():
+			line = line.strip().rstrip(",")
+			if not line or line.startswith("CONSTRAINT"):
+				continue
+			name, col_type = line.split()[:2]
+			columns[name] = PG_TYPES[re.sub(r"\(.*", "", col_type)]
+
+		result[match.group(1)] = columns
+
+	return result
+
+
+def get_column_types(table_name, columns=None):
+	"""
+		Column types of a table, from db/sql/FlightArrival_create.sql
+	:param table_name: Table name
+	:param columns: Columns (all the table columns if None)
+	:return: list with the postgres type of each column
+	"""
+	global tables
+	if tables is None:
+		tables = read_schema()
+
+	table = tables[table_name]
+	if columns is None:
+		columns = table.keys()
+
+	return [table[col] for col in columns]
@@ -0,0 +1,171 @@
+import logging
+import queue
+import threading
+import time
+
+STOP = object()
+
+
+class StageStats:
+	"""
+		Counters of one pipeline stage. 'busy' is the time spent inside the stage function (summed over all the
+		threads of the stage), so rows / busy is the throughput of the stage by itself.
+	"""
+
+	def __init__(self, name):
+		self.name = name
+		self.chunks = 0
+		self.rows = 0
+		self.busy = 0.0
+		self.__lock = threading.Lock()
+
+	def add(self, rows, elapsed):
+		with self.__lock:
+			self.chunks += 1
+			self.rows += rows
+			self.busy += elapsed
+
+	def __str__(self):
+		rate = self.rows / self.busy if self.busy > 0 else 0
+		return "{} - {} chunks, {} rows, {:.2f} s, {:.0f} rows/s".format(
+			self.name, self.chunks, self.rows, self.busy, rate)
+
+
+class ChunkPipeline:
+	"""
+		Runs a chunk load in three stages connected by bounded queues:
+		- reader: one thread iterating the source (decompress and parse);
+		- workers: a pool of threads calling 'work' for each chunk (e.g. lookups and transform);
+		- writer: the calling thread, calling 'write' for each chunk in the source order.
+		The queues limit the chunks in memory to about 2 * queue_depth + workers.
+	"""
+
+	def __init__(self, source, work, write, workers=2, queue_depth=4, name="Pipeline"):
+		"""
+		:param source: Iterable of dataframes
+		:param work: function(df) -> df
+		:param write: function(df)
+		:param workers: Number of work threads
+		:param queue_depth: Max chunks waiting in each queue
+		:param name: Name used in the log
+		"""
+		if workers < 1:
+			raise ValueError("The pipeline needs at least one worker")
+
+		self.source = source
+		self.work = work
+		self.write = write
+		self.workers = workers
+		self.name = name
+		self.stats = [StageStats("read"), StageStats("work"), StageStats("write")]
+		self.__work_queue = queue.Queue(maxsize=queue_depth)
+		self.__write_queue = queue.Queue(maxsize=queue_depth)
+		self.__failed = threading.Event()
+		self.__errors = []
+
+	def __put(self, target_queue, item):
+		"""
+			Blocking put that gives up when another stage failed.
+		"""
+		while not self.__failed.is_set():
+			try:
+				target_queue.put(item, timeout=0.5)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def __get(self, source_queue):
+		while not self.__failed.is_set():
+			try:
+				return source_queue.get(timeout=0.5)
+			except queue.Empty:
+				pass
+		return STOP
+
+	def __fail(self, error):
+		self.__errors.append(error)
+		self.__failed.set()
+
+	def __read(self):
+		try:
+			df_iter = iter(self.source)
+			seq = 0
+			while True:
+				start_time = time.time()
+				df = next(df_iter, STOP)
+				if df is STOP:
+					break
+				self.stats[0].add(len(df), time.time() - start_time)
+				if not self.__put(self.__work_queue, (seq, df)):
+					return
+				seq += 1
+		except Exception as e:
+			self.__fail(e)
+		finally:
+			for _ in range(self.workers):
+				self.__put(self.__work_queue, STOP)
+
+	def __do_work(self):
+		try:
+			while True:
+				item = self.__get(self.__work_queue)
+				if item is STOP:
+					break
+				seq, df = item
+				start_time = time.time()
+				df = self.work(df)
+				self.stats[1].add(len(df), time.time() - start_time)
+				if not self.__put(self.__write_queue, (seq, df)):
+					return
+		except Exception as e:
+			self.__fail(e)
+		finally:
+			self.__put(self.__write_queue, STOP)
+
+	def run(self):
+		"""
+			Runs the pipeline until the source is over.
+			The first error of any stage stops all the stages and is raised here.
+		:return: list of StageStats (read, work, write)
+		"""
+		threads = [threading.Thread(target=self.__read, name="{}-read".format(self.name))]
+		threads += [
+			threading.Thread(target=self.__do_work, name="{}-work-{}".format(self.name, i)) for i in range(self.workers)]
+		for thread in threads:
+			thread.daemon = True
+			thread.start()
+
+		start_time = time.time()
+		pending = {}
+		next_seq = 0
+		running_workers = self.workers
+		try:
+			while running_workers > 0:
+				item = self.__get(self.__write_queue)
+				if item is STOP:
+					running_workers -= 1
+					continue
+
+				seq, df = item
+				pending[seq] = df
+				while next_seq in pending:
+					df = pending.pop(next_seq)
+					write_start = time.time()
+					self.write(df)
+					self.stats[2].add(len(df), time.time() - write_start)
+					next_seq += 1
+		except Exception as e:
+			self.__fail(e)
+
+		for thread in threads:
+			thread.join()
+
+		if self.__errors:
+			raise self.__errors[0]
+
+		logging.info("{} - {:.2f} s".format(self.name, time.time() - start_time))
+		for stats in self.stats:
+			logging.info("{} - {}".format(self.name, stats))
+
+		return self.stats
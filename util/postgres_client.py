@@ -2,7 +2,10 @@
 import sqlalchemy
 import pandas as pd
 import json
-import io
+import threading
+
+from util.copy_stream import CopyStream
+from util.pg_schema import get_column_types
 
 
 class PostgresClient:
@@ -10,12 +13,18 @@ class PostgresClient:
 		Classe para encapsular conexão com Postgres
 	"""
 
-	def __init__(self, auth_path="auth/postgres.json"):
+	def __init__(self, auth_path="auth/postgres.json", pool_size=5, max_overflow=10):
 		"""
 			Construtor
 		:param auth_path: Caminho do arquivo json com HOST, DB, USER, PWD e PORT
+		:param pool_size: Conexões mantidas no pool
+		:param max_overflow: Conexões extras permitidas (ex: pool de writers do COPY)
 		"""
 		self.__conn_engine = None
+		# estágios da carga (util.stage_dag) pedem o engine de threads diferentes
+		self.__lock = threading.Lock()
+		self.__pool_size = pool_size
+		self.__max_overflow = max_overflow
 		self.__auth_params = None
 		self.__auth_path = auth_path
 		self.__connection_string = "postgresql+psycopg2://{USER}:{PWD}@{HOST}:{PORT}/{DB}"
@@ -36,16 +45,23 @@ class PostgresClient:
 		conn_params = self.__connection_string.format(**self.__auth_params)
 		self.__conn_engine = sqlalchemy.create_engine(
 			conn_params,
-			pool_size=5,
-			max_overflow=0
+			pool_size=self.__pool_size,
+			max_overflow=self.__max_overflow
 		)
 
+	def get_max_connections(self):
+		"""
+			Máximo de conexões abertas ao mesmo tempo pelo engine (pool_size + max_overflow)
+		"""
+		return self.__pool_size + self.__max_overflow
+
 	def get_conn_engine(self) -> sqlalchemy.engine.Engine:
 		"""
 			Retorna a conexão ODBC com o SQL server
 		"""
-		if self.__conn_engine is None:
-			self.__authenticate()
+		with self.__lock:
+			if self.__conn_engine is None:
+				self.__authenticate()
 
 		return self.__conn_engine
 
@@ -84,9 +100,11 @@ class PostgresClient:
 	@staticmethod
 	def copy_df_to_table(
 			df, table_name, cursor, commit_connection=None, sep=";", header=False, index=False,
-			columns=None, df_columns=None):
+			columns=None, df_columns=None, binary=False, column_types=None, buffer_rows=5000):
 		"""
-			Copiar um dataframe para o postgres usando o COPY
+			Copiar um dataframe para o postgres usando o COPY.
+			As linhas são serializadas sob demanda, enquanto o postgres lê (ver util.copy_stream), então
+			no máximo 'buffer_rows' linhas serializadas ficam em memória.
 		:param df: Dataframe
 		:param table_name: Nome da tabela de destino
 		:param cursor: Cursor já aberto
@@ -96,20 +114,37 @@ class PostgresClient:
 		:param index: Indica se atualiza índice
 		:param columns: Colunas da tabela destino
 		:param df_columns: Colunas do dataframe que serão exportadas
+		:param binary: Usa o formato binário do COPY, gerado direto dos arrays do dataframe (sem texto)
+		:param column_types: Tipos postgres das colunas (modo binário). Padrão: tipos de db/sql/FlightArrival_create.sql
+		:param buffer_rows: Quantidade de linhas serializadas por vez
+		:return: Quantidade de bytes enviados
 		"""
-		output = io.StringIO()
-		df.to_csv(output, sep=sep, header=header, index=index, columns=df_columns)
-		output.seek(0)
-		cursor.copy_from(output, table_name, null="", sep=sep, columns=columns)
+		if binary:
+			columns = list(columns if columns is not None else df.columns)
+			df_columns = list(df_columns if df_columns is not None else columns)
+			if column_types is None:
+				column_types = get_column_types(table_name, columns)
+
+			stream = CopyStream.from_df_binary(df, df_columns, column_types, buffer_rows=buffer_rows)
+			cursor.copy_expert(
+				"COPY {} ({}) FROM STDIN WITH (FORMAT binary)".format(table_name, ", ".join(columns)), stream)
+		else:
+			stream = CopyStream.from_df_text(
+				df, sep=sep, header=header, index=index, df_columns=df_columns, buffer_rows=buffer_rows)
+			cursor.copy_from(stream, table_name, null="", sep=sep, columns=columns)
+
 		if commit_connection is not None:
 			commit_connection.commit()
 
+		return stream.bytes_read
+
 	@staticmethod
 	def copy_df_to_csv_table(
 			df, table_name, cursor, commit_connection=None, sep=";", header=False, index=False,
-			columns=None, df_columns=None, file_name="/tmp/file_{}.csv"):
+			columns=None, df_columns=None, file_name=None):
 		"""
-			Copiar um dataframe para o postgres usando o COPY (intermédio de um CSV)
+			Copiar um dataframe para o postgres usando o COPY (formato CSV).
+			O CSV não é mais gravado em arquivo: as linhas são enviadas sob demanda (ver copy_df_to_table).
 		:param df: Dataframe
 		:param table_name: Nome da tabela de destino
 		:param cursor: Cursor já aberto
@@ -119,14 +154,8 @@ class PostgresClient:
 		:param index: Indica se atualiza índice
 		:param columns: Colunas da tabela destino
 		:param df_columns: Colunas do dataframe que serão exportadas
+		:param file_name: Não usado (mantido por compatibilidade)
 		"""
-		file_name = file_name.format(table_name)
-
-		df.to_csv(file_name, sep=sep, header=header, index=index, columns=df_columns)
-		file = open(file_name, 'r')
-		try:
-			cursor.copy_from(file, table_name, null="", sep=sep, columns=columns)
-			if commit_connection is not None:
-				commit_connection.commit()
-		finally:
-			file.close()
\ No newline at end of file
+		return PostgresClient.copy_df_to_table(
+			df=df, table_name=table_name, cursor=cursor, commit_connection=commit_connection, sep=sep,
+			header=header, index=index, columns=columns, df_columns=df_columns)
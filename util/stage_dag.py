@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import time
+
+
+class Stage:
+	"""
+		One step of a load: a function and the names of the stages it depends on.
+	"""
+
+	def __init__(self, name, run, depends=()):
+		"""
+		:param name: Stage name
+		:param run: function() that runs the stage
+		:param depends: Names of the stages that must finish before this one
+		"""
+		self.name = name
+		self.run = run
+		self.depends = list(depends)
+		self.status = "skipped"
+		self.start_time = None
+		self.elapsed = 0.0
+
+
+class StageDag:
+	"""
+		Runs the stages of a load as a DAG: a stage starts, in a thread of the pool, as soon as all the stages
+		it depends on are finished, so independent stages (e.g. the dimensions) run at the same time, each one
+		with its own connections.
+
+		Only the selected stages are run; the dependencies not selected are considered already done (e.g. only
+		the fact, with the dimensions loaded by a previous run). After the first error no other stage is
+		started and the error is raised once the running stages finish.
+	"""
+
+	def __init__(self, stages, threads=4, name="StageDag"):
+		"""
+		:param stages: list of Stage
+		:param threads: Max stages running at the same time
+		:param name: Name used in the log
+		"""
+		self.stages = {}
+		for stage in stages:
+			if stage.name in self.stages:
+				raise ValueError("Duplicated stage {}".format(stage.name))
+			self.stages[stage.name] = stage
+
+		for stage in stages:
+			for depend in stage.depends:
+				if depend not in self.stages:
+					raise ValueError("Stage {} depends on the unknown stage {}".format(stage.name, depend))
+
+		self.threads = threads
+		self.name = name
+
+	def get_selected(self, selected=None):
+		"""
+			Stages to be run, in the order they were given
+		:param selected: Stage names (None runs all of them)
+		:return: list of Stage
+		"""
+		if selected is None:
+			return list(self.stages.values())
+
+		unknown = [name for name in selected if name not in self.stages]
+		if unknown:
+			raise ValueError("Unknown stages: {}. Stages: {}".format(", ".join(unknown), ", ".join(self.stages)))
+
+		return [stage for stage in self.stages.values() if stage.name in selected]
+
+	def __run_stage(self, stage):
+		stage.status = "running"
+		stage.start_time = time.time()
+		logging.info("{} - {} started".format(self.name, stage.name))
+		try:
+			stage.run()
+			stage.status = "done"
+		except Exception:
+			stage.status = "failed"
+			raise
+		finally:
+			stage.elapsed = time.time() - stage.start_time
+			logging.info("{} - {} {} - {:.2f} s".format(self.name, stage.name, stage.status, stage.elapsed))
+
+	def run(self, selected=None):
+		"""
+			Runs the selected stages, respecting the dependencies, and logs the wall time of each one.
+		:param selected: Stage names (None runs all of them)
+		:return: list of the stages run
+		"""
+		stages = self.get_selected(selected)
+		names = set(stage.name for stage in stages)
+		waiting = list(stages)
+		finished = set()
+		running = {}
+		errors = []
+		start_time = time.time()
+
+		with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix=self.name) as executor:
+			while waiting or running:
+				if not errors:
+					for stage in [stage for stage in waiting if all(
+							depend in finished or depend not in names for depend in stage.depends)]:
+						waiting.remove(stage)
+						running[executor.submit(self.__run_stage, stage)] = stage
+				if not running:
+					break
+
+				done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+				for future in done:
+					stage = running.pop(future)
+					if future.exception() is not None:
+						errors.append(future.exception())
+					else:
+						finished.add(stage.name)
+
+		if waiting and not errors:
+			raise ValueError("Stages with cyclic dependencies: {}".format(", ".join(s.name for s in waiting)))
+
+		self.log_summary(stages, time.time() - start_time)
+		if errors:
+			raise errors[0]
+
+		return stages
+
+	def log_summary(self, stages, elapsed):
+		"""
+			Logs the status and the wall time of each stage
+		"""
+		logging.info("{} - {:<16} {:<8} {:>10}".format(self.name, "stage", "status", "wall (s)"))
+		for stage in stages:
+			logging.info("{} - {:<16} {:<8} {:>10.2f}".format(self.name, stage.name, stage.status, stage.elapsed))
+		logging.info("{} - {:<16} {:<8} {:>10.2f}".format(self.name, "total", "", elapsed))
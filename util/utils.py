@@ -1,27 +1,88 @@
-import urllib.request
-import shutil
+import threading
 
+from util.dimension_cache import DimensionCache
+from util.download_manager import DownloadManager
+from util.metrics import Metrics
 from util.postgres_client import PostgresClient
 from definitions import ROOT_DIR
 import os
 
 postgres = None
+dimension_cache = None
+download_manager = None
+metrics = None
+# The stages of a load (see util.stage_dag) create the singletons from different threads
+lock = threading.Lock()
+# Connections of the engine besides the COPY writers (lookups, summaries, dimension stages)
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
 
 
-def download_file(url, file_name):
-	with urllib.request.urlopen(url) as response, open(file_name, 'wb') as out_file:
-		shutil.copyfileobj(response, out_file)
+def get_metrics():
+	"""
+		Metrics of the process (see util.metrics). FL_ARR_METRICS_LOG=0 logs only the summary, not every measure.
+	"""
+	global metrics
+	with lock:
+		if metrics is None:
+			metrics = Metrics(log_measures=os.getenv("FL_ARR_METRICS_LOG", "1") == "1")
+
+	return metrics
+
+
+def get_download_manager():
+	"""
+		Download manager of the raw files, with its cache in FL_ARR_DOWNLOAD_DIR (default: raw/downloads)
+	"""
+	global download_manager
+	with lock:
+		if download_manager is None:
+			download_manager = DownloadManager(
+				cache_dir=os.getenv("FL_ARR_DOWNLOAD_DIR", os.path.join(ROOT_DIR, "raw", "downloads")))
+
+	return download_manager
 
 
 def get_db_client():
+	"""
+		Postgres client of the process. Each COPY writer of the fact (FL_ARR_WRITERS) holds a connection for the
+		whole load, so the engine allows one more connection per writer.
+	"""
 	global postgres
-	if postgres is None:
-		postgres = PostgresClient(
-			auth_path=os.path.join(ROOT_DIR, "auth", "{}.json".format(os.getenv("PGHOST", "localhost"))))
+	with lock:
+		if postgres is None:
+			postgres = PostgresClient(
+				auth_path=os.path.join(ROOT_DIR, "auth", "{}.json".format(os.getenv("PGHOST", "localhost"))),
+				pool_size=POOL_SIZE,
+				max_overflow=MAX_OVERFLOW + int(os.getenv("FL_ARR_WRITERS", "0")))
 
 	return postgres
 
 
+def get_dimension_cache():
+	global dimension_cache
+	db_client = get_db_client()
+	with lock:
+		if dimension_cache is None:
+			dimension_cache = DimensionCache(db_client)
+
+	return dimension_cache
+
+
+def reset_db_client():
+	"""
+		Disposes the engine (closing its pooled connections) and forgets the client and the dimension cache.
+		A forked process must not use the connections of its parent: the parent resets them before the fork and
+		each new process resets what it inherited (e.g. as the initializer of a multiprocessing.Pool).
+	"""
+	global postgres, dimension_cache
+	with lock:
+		if postgres is not None:
+			postgres.get_conn_engine().dispose()
+		postgres = None
+		dimension_cache = None
+
+
 def sum_lists_without_duplicates(first: list, second: list):
 	"""
 		Faz a junção de duas listas, removendo os duplicados